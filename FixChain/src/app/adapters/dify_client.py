@@ -1,7 +1,9 @@
 from __future__ import annotations
+import functools
 import os
 from typing import Any, Dict, Optional, TypedDict
 from pydantic import BaseModel
+import orjson
 import requests
 from requests.adapters import HTTPAdapter, Retry
 
@@ -13,6 +15,11 @@ DEFAULT_BASE_URL = "https://api.dify.ai/v1"
 def _get_base_url() -> str:
     return os.getenv("DIFY_BASE_URL", DEFAULT_BASE_URL).rstrip("/")
 
+@functools.lru_cache(maxsize=1)
+def _workflow_url() -> str:
+    # env không đổi trong 1 process → dựng URL 1 lần (cache_clear() nếu đổi DIFY_BASE_URL lúc chạy)
+    return f"{_get_base_url()}/workflows/run"
+
 class DifyRunResponse(BaseModel):
     # Những field phổ biến của Dify workflow/text generation; tuỳ app có thể dư/thiếu   
     id: Optional[str] = None
@@ -38,6 +45,15 @@ def _make_session() -> requests.Session:
     session.mount("https://", adapter)
     return session
 
+_session: Optional[requests.Session] = None
+
+def _get_session() -> requests.Session:
+    """Session dùng chung cho mọi lần gọi: giữ connection pool/TLS keep-alive giữa các request."""
+    global _session
+    if _session is None:
+        _session = _make_session()
+    return _session
+
 def _headers(api_key: str) -> Dict[str, str]:
     if not api_key or not api_key.strip():
         logger.error("Missing Dify API key")
@@ -67,17 +83,17 @@ def run_workflow_with_dify(
     Returns:
         DifyRunResponse (dict có thể chứa "data" -> "outputs"...)
     """
-    base_url = _get_base_url()
-    url = f"{base_url}/workflows/run"
+    url = _workflow_url()
 
     # Log an toàn, không in key
     logger.info("Dify run workflow: %s (mode=%s)", url, response_mode)
 
-    payload = {"inputs": inputs, "user": user_id, "response_mode": response_mode}
+    # orjson → bytes gửi thẳng (Content-Type đã set trong _headers); inputs chứa cả danh sách bug nên payload lớn
+    body = orjson.dumps({"inputs": inputs, "user": user_id, "response_mode": response_mode})
 
-    session = _make_session()
+    session = _get_session()
     try:
-        resp = session.post(url, headers=_headers(api_key), json=payload, timeout=timeout)
+        resp = session.post(url, headers=_headers(api_key), data=body, timeout=timeout)
     except requests.exceptions.Timeout:
         logger.error("Dify API request timed out: %s", url)
         raise
@@ -93,7 +109,7 @@ def run_workflow_with_dify(
         resp.raise_for_status()  # raise để upstream biết failed
 
     try:
-        data = resp.json()
+        data = orjson.loads(resp.content)  # JSONDecodeError là lớp con của ValueError
         logger.debug("Dify keys: %s", list(data.keys()))
         logger.debug("Dify task_id: %s", data.get("task_id"))
         logger.debug("Dify outputs keys: %s", list(data.get("data", {}).get("outputs", {}).keys()))
@@ -104,7 +120,9 @@ def run_workflow_with_dify(
     if isinstance(data, dict) and "error" in data:
         logger.warning("Dify response contains error: %s", data.get("error"))
 
-    return DifyRunResponse(
+    # data vừa parse từ JSON của Dify (đã tin cậy) → model_construct bỏ qua validate,
+    # tránh pydantic duyệt + copy lại toàn bộ raw/data (chứa cả danh sách bug) mỗi lần gọi
+    return DifyRunResponse.model_construct(
             id=data.get("task_id"),
             status=data.get("status") or data.get("data", {}).get("status"),
             data=data.get("data") or data.get("output"),
@@ -63,7 +63,15 @@ Basic usage:
 
 from __future__ import annotations
 import asyncio
-from typing import Any, Dict, List, Optional
+import functools
+import hashlib
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import orjson
 from mcp import ClientSession
 from mcp.client.sse import sse_client
 
@@ -71,6 +79,68 @@ class SerenaError(RuntimeError):
     pass
 
 
+# Tool chỉ đọc → có thể trả từ cache. FILE_SCOPED gắn với version của 1 file,
+# PROJECT_SCOPED có thể quét nhiều file nên gắn với bộ đếm ghi toàn cục.
+_FILE_SCOPED_READS = frozenset({"read_file", "get_symbols_overview"})
+_PROJECT_SCOPED_READS = frozenset({"find_symbol", "find_referencing_symbols", "search_for_pattern"})
+# Tool ghi theo path → bump version của path đó; exec/không rõ path → bump toàn cục
+_PATH_WRITES = frozenset({
+    "replace_regex", "replace_symbol_body", "replace_lines",
+    "insert_before_symbol", "insert_after_symbol", "create_text_file",
+})
+_PATH_KEYS = ("relative_path", "path", "file", "file_path")
+_TOOL_CACHE_MAX = 128
+# chặn độ "cũ" của cache đọc khi file bị đổi ngoài session (process khác, exec của Serena...)
+_TOOL_CACHE_TTL_S = float(os.getenv("SERENA_TOOL_CACHE_TTL_S", "60"))
+
+# Tên key "thân thiện" → các alias có thể gặp trong schema của tool. Tên group luôn là alias đầu.
+# Wrapper chỉ truyền key chuẩn; _map_params tự đổi sang alias mà schema dùng. Alias dùng chung
+# ("text", "limit") được truyền khi giá trị phải khớp được nhiều group (vd. body lẫn new_text).
+_SYNONYMS: Dict[str, Tuple[str, ...]] = {
+    # file-ish
+    "path": ("path", "file", "file_path", "filepath", "relative_path"),
+    "name_path": ("name_path", "symbol", "symbol_path", "qualified_name"),
+    # search/replace
+    "pattern": ("pattern", "regex", "regexp"),
+    "replacement": ("replacement", "with", "new_text", "text"),
+    "new_body": ("new_body", "body", "text"),
+    "start": ("start", "start_line", "from_line", "line_start"),
+    "end": ("end", "end_line", "to_line", "line_end"),
+    # limits/counts
+    "max_matches": ("max_matches", "limit"),
+    "max_results": ("max_results", "limit"),
+    "count": ("count", "max_replacements"),
+    "flags": ("flags",),
+    # referencing symbols / options
+    "include_definitions": ("include_definitions", "include_defs", "with_definitions"),
+    "kinds": ("kinds", "symbol_kinds", "symbolKinds", "types"),
+    # shell exec
+    "command": ("command", "cmd", "shell_command", "sh", "bash"),
+    "cwd": ("cwd", "workdir", "working_directory", "dir"),
+    "env": ("env", "environment"),
+    "shell": ("shell",),
+    "timeout": ("timeout", "timeout_s", "seconds"),
+    "max_bytes": ("max_bytes", "max_answer_chars"),
+    "offset": ("offset", "start_offset", "byte_offset"),
+}
+# Khoảng tối thiểu giữa 2 lần tools/list (trừ khi refresh=True) → bão lỗi "thiếu tool" không kéo theo bão refresh
+_TOOLS_REFRESH_MIN_S = 2.0
+# submit(): số lời gọi tối đa consumer gom lại và dispatch cùng lúc mỗi lượt
+_SUBMIT_BATCH = max(1, int(os.getenv("SERENA_SUBMIT_BATCH", "8")))
+# Cache tools/list trên đĩa giữa các lần chạy, khoá theo (sse_url, tên + version server).
+# Tool thiếu trong index cũ → _call_tool_flex tự refresh nên cache lệch cũng tự lành.
+_TOOLS_CACHE_DIR = Path(os.getenv("SERENA_CACHE_DIR") or Path(tempfile.gettempdir()) / "fixchain-serena")
+# (schema keys, [(aliases, alias có trong schema, key đích)]) — dựng sẵn cho từng tool
+ParamPlan = Tuple[frozenset, Tuple[Tuple[Tuple[str, ...], Tuple[str, ...], str], ...]]
+
+
+@functools.lru_cache(maxsize=8)
+def _read_tools_cache(path: str, mtime_ns: int) -> Any:
+    # mtime nằm trong key → file được ghi lại thì tự đọc lại; các SerenaClient
+    # trong cùng process dùng chung 1 lần đọc + parse
+    return orjson.loads(Path(path).read_bytes())
+
+
 class SerenaClient:
     """
     Minimal, safe wrapper around Serena MCP.
@@ -98,17 +168,51 @@ class SerenaClient:
         self._client_ctx = None
         self._session = None
         self._tools_index = {}
+        self._tool_names: Tuple[str, ...] = ()
+        self._param_plans: Dict[str, Optional[ParamPlan]] = {}
+        # tool đã refresh mà vẫn không có → không gọi tools/list lại mỗi lần hỏi tới nó
+        self._missing_tools: set = set()
+        # tools/list chỉ chạy 1 cái tại 1 thời điểm; các lời gọi đến cùng lúc dùng chung kết quả
+        self._refresh_lock = asyncio.Lock()
+        self._last_refresh = 0.0
+        # key → (hết hạn lúc [monotonic], kết quả)
+        self._tool_cache: "OrderedDict[Tuple[Any, ...], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._file_version: Dict[str, int] = {}
+        self._project_gen = 0
+        self._write_gen = 0
+        # False sau khi 1 lời gọi tool bị timeout: request có thể còn treo trên session
+        # → người giữ session (serena_runner) nên đóng và mở kết nối mới
+        self.healthy = True
+        self._server_key: Optional[str] = None
+        # hàng đợi submit() + task consumer, tạo lazy ở lần submit đầu tiên
+        self._pending: Optional["asyncio.Queue[Tuple[str, Dict[str, Any], asyncio.Future]]"] = None
+        self._consumer: Optional[asyncio.Task] = None
 
     async def __aenter__(self) -> "SerenaClient":
         # KHÔNG gọi stdio_client nữa
         self._client_ctx = sse_client(self.sse_url)
-        self._read, self._write = await self._client_ctx.__aenter__()
-        self._session = ClientSession(self._read, self._write)
-        await asyncio.wait_for(self._session.initialize(), timeout=self.init_timeout_s)
-        await self._refresh_tools_index()
+        # asyncio.timeout chạy trong cùng task → an toàn với cancel scope của anyio bên trong sse_client
+        async with asyncio.timeout(self.init_timeout_s):
+            self._read, self._write = await self._client_ctx.__aenter__()
+        try:
+            self._session = ClientSession(self._read, self._write)
+            init = await asyncio.wait_for(self._session.initialize(), timeout=self.init_timeout_s)
+            info = getattr(init, "serverInfo", None)
+            self._server_key = f"{getattr(info, 'name', '')}:{getattr(info, 'version', '')}" if info else None
+            # I/O đĩa chạy ở thread → không chặn event loop dùng chung (serena_runner)
+            cached = await asyncio.to_thread(self._load_tools_cache)
+            if cached is not None:
+                self._set_tools_index(cached)
+            else:
+                await self._refresh_tools_index()
+        except BaseException as e:
+            # __aexit__ không được gọi khi __aenter__ lỗi → tự đóng kết nối SSE đã mở
+            await self._client_ctx.__aexit__(type(e), e, e.__traceback__)
+            raise
         return self
 
     async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self._stop_consumer()
         if self._session:
             try:
                 print("\nReach here.....")
@@ -119,57 +223,165 @@ class SerenaClient:
             await self._client_ctx.__aexit__(exc_type, exc, tb)
         print("\nAexit done")
 
-    async def _refresh_tools_index(self) -> None:
+    async def _refresh_tools_index(self, force: bool = False) -> None:
         assert self._session is not None
-        tools = await self._session.list_tools()
-        print("\n refresh_tools done")
-        index: Dict[str, Dict[str, Any]] = {}
-        for t in tools.tools:
-            index[t.name] = {
-                "inputSchema": getattr(t, "inputSchema", None),
-                "description": getattr(t, "description", ""),
-            }
+        requested = time.monotonic()
+        async with self._refresh_lock:
+            # refresh khác đã xong trong lúc chờ lock, hoặc vừa refresh cách đây chưa tới N giây → dùng luôn
+            if self._last_refresh >= requested or (
+                not force and self._tools_index and requested - self._last_refresh < _TOOLS_REFRESH_MIN_S
+            ):
+                return
+            tools = await asyncio.wait_for(self._session.list_tools(), timeout=self.init_timeout_s)
+            print("\n refresh_tools done")
+            index: Dict[str, Dict[str, Any]] = {}
+            for t in tools.tools:
+                index[t.name] = {
+                    "inputSchema": getattr(t, "inputSchema", None),
+                    "description": getattr(t, "description", ""),
+                }
+            self._set_tools_index(index)
+            self._last_refresh = time.monotonic()
+        await asyncio.to_thread(self._save_tools_cache, index)
+
+    def _set_tools_index(self, index: Dict[str, Dict[str, Any]]) -> None:
         self._tools_index = index
+        self._missing_tools = set()
+        self._tool_names = tuple(sorted(index))
+        self._param_plans = {
+            name: self._build_param_plan((meta["inputSchema"] or {}).get("properties") or {})
+            for name, meta in index.items()
+        }
+
+    def _tools_cache_path(self) -> Optional[Path]:
+        if not self._server_key:
+            return None  # server không báo version → không biết khi nào cache hết hợp lệ
+        digest = hashlib.sha1(f"{self.sse_url}|{self._server_key}".encode()).hexdigest()[:16]
+        return _TOOLS_CACHE_DIR / f"tools_{digest}.json"
+
+    def _load_tools_cache(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        path = self._tools_cache_path()
+        if path is None:
+            return None
+        try:
+            data = _read_tools_cache(str(path), path.stat().st_mtime_ns)
+        except (OSError, orjson.JSONDecodeError):
+            return None
+        if not isinstance(data, dict) or data.get("server") != self._server_key or not isinstance(data.get("tools"), dict):
+            return None
+        return data["tools"]
+
+    def _save_tools_cache(self, index: Dict[str, Dict[str, Any]]) -> None:
+        path = self._tools_cache_path()
+        if path is None:
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(orjson.dumps({"server": self._server_key, "tools": index}, default=str))
+                os.replace(tmp, path)  # ghi atomic: process khác không đọc phải file dở
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except (OSError, TypeError):
+            pass  # cache chỉ là tối ưu, lỗi ghi không ảnh hưởng session
 
     # ---------- Public high-level APIs ----------
 
-    async def list_tools(self) -> List[str]:
-        """Return list of exposed tool names (cached)."""
-        if not self._tools_index:
-            await self._refresh_tools_index()
-        return sorted(self._tools_index.keys())
+    async def list_tools(self, refresh: bool = False) -> List[str]:
+        """Return list of exposed tool names (cached; refresh=True forces a tools/list round-trip)."""
+        if refresh or not self._tools_index:
+            await self._refresh_tools_index(force=refresh)
+        return list(self._tool_names)
+
+    async def call_many(
+        self, calls: List[Tuple[str, Dict[str, Any]]]
+    ) -> List[Any]:
+        """
+        Fire independent tool calls concurrently over the same session (MCP multiplexes by request id).
+        Results keep the order of `calls`; a failing call yields its exception instead of aborting the rest.
+        Only for calls that do not depend on each other (e.g. reads of different files).
+        """
+        return await asyncio.gather(
+            *(self._call_tool_flex(tool, params) for tool, params in calls),
+            return_exceptions=True,
+        )
+
+    def submit(self, tool: str, params: Dict[str, Any]) -> "asyncio.Future[Dict[str, Any]]":
+        """
+        Queue a tool call and return a future for its result (await it when needed).
+        A background consumer drains up to SERENA_SUBMIT_BATCH queued calls at a time and
+        dispatches them together, so callers can enqueue many calls without awaiting in between.
+        Calls in one batch run concurrently → only submit calls that do not depend on each other.
+        """
+        loop = asyncio.get_running_loop()
+        if self._pending is None:
+            self._pending = asyncio.Queue()
+            self._consumer = loop.create_task(self._drain_pending(self._pending))
+        fut: "asyncio.Future[Dict[str, Any]]" = loop.create_future()
+        self._pending.put_nowait((tool, params, fut))
+        return fut
+
+    async def _drain_pending(self, q: "asyncio.Queue[Tuple[str, Dict[str, Any], asyncio.Future]]") -> None:
+        while True:
+            items = [await q.get()]
+            while len(items) < _SUBMIT_BATCH and not q.empty():
+                items.append(q.get_nowait())
+            try:
+                results = await asyncio.gather(
+                    *(self._call_tool_flex(tool, params) for tool, params, _ in items),
+                    return_exceptions=True,
+                )
+            except asyncio.CancelledError:
+                for _, _, fut in items:
+                    fut.cancel()
+                raise
+            for (_, _, fut), res in zip(items, results):
+                if fut.done():  # caller đã huỷ
+                    continue
+                if isinstance(res, BaseException):
+                    fut.set_exception(res)
+                else:
+                    fut.set_result(res)
+
+    async def _stop_consumer(self) -> None:
+        task, q = self._consumer, self._pending
+        self._consumer = self._pending = None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        while q is not None and not q.empty():
+            q.get_nowait()[2].cancel()
 
     async def apply_patch_by_symbol(
         self,
         name_path: str,
         relative_path: str,
         new_body: str,
+        verify: bool = False,
     ) -> Dict[str, Any]:
         """
         Replace the body of a function/method/class identified by its name path.
         Example name_path: "pkg.mod:Class.method" or "pkg.mod:function".
+        verify=True resolves the symbol with find_symbol first and raises SerenaError if it is
+        missing (1 extra round-trip). For impact analysis use find_referencing_symbols instead.
         """
-        await self._call_tool_flex(
-            "find_symbol",
-            {
-                "name_path": name_path,
-                "relative_path": relative_path,
-                "path": relative_path,
-                "file": relative_path,
-            },
-            must_exist=False,
-        )
+        # Mặc định không gọi find_symbol "dò trước": replace_symbol_body tự resolve theo name_path
+        # và tự báo lỗi khi symbol thiếu → bớt 1 round-trip MCP mỗi patch
+        if verify:
+            found = await self._call_tool_flex(
+                "find_symbol", {"name_path": name_path, "relative_path": relative_path}
+            )
+            if self._result_text(found).strip() in ("", "[]"):
+                raise SerenaError(f"Symbol not found: {name_path} in {relative_path}")
         return await self._call_tool_flex(
             "replace_symbol_body",
-            {
-                "name_path": name_path,
-                "relative_path": relative_path,
-                "path": relative_path,
-                "file": relative_path,
-                "new_body": new_body,
-                "body": new_body,
-                "text": new_body,
-            },
+            {"name_path": name_path, "relative_path": relative_path, "text": new_body},
         )
 
     async def apply_patch_by_regex(
@@ -183,20 +395,10 @@ class SerenaClient:
         """
         Regex-based replacement inside a file. Use anchors/context to be safe.
         """
-        payload: Dict[str, Any] = {
-            "path": path,
-            "file": path,
-            "file_path": path,
-            "pattern": pattern,
-            "regex": pattern,
-            "replacement": replacement,
-            "with": replacement,
-        }
-        if count is not None:
-            payload.update({"count": count, "max_replacements": count})
-        if flags:
-            payload.update({"flags": flags})
-        return await self._call_tool_flex("replace_regex", payload)
+        return await self._call_tool_flex(
+            "replace_regex",
+            {"path": path, "pattern": pattern, "replacement": replacement, "count": count, "flags": flags or None},
+        )
 
     async def replace_lines(
         self,
@@ -210,59 +412,74 @@ class SerenaClient:
         """
         return await self._call_tool_flex(
             "replace_lines",
-            {
-                "path": path,
-                "file": path,
-                "file_path": path,
-                "start": start_line,
-                "start_line": start_line,
-                "from_line": start_line,
-                "end": end_line,
-                "end_line": end_line,
-                "to_line": end_line,
-                "text": new_text,
-                "new_text": new_text,
-                "replacement": new_text,
-            },
+            {"path": path, "start": start_line, "end": end_line, "text": new_text},
         )
 
     async def search_for_pattern(
         self, path: str, pattern: str, max_matches: Optional[int] = None
     ) -> Dict[str, Any]:
-        payload: Dict[str, Any] = {
-            "path": path,
-            "file": path,
-            "file_path": path,
-            "pattern": pattern,
-            "regex": pattern,
-        }
-        if max_matches is not None:
-            payload.update({"max_matches": max_matches, "limit": max_matches})
-        return await self._call_tool_flex("search_for_pattern", payload)
+        return await self._call_tool_flex(
+            "search_for_pattern", {"path": path, "pattern": pattern, "limit": max_matches}
+        )
 
     async def read_file(self, path: str, max_bytes: Optional[int] = None) -> Dict[str, Any]:
-        payload: Dict[str, Any] = {
-            "path": path,
-            "file": path,
-            "file_path": path,
-        }
-        if max_bytes is not None:
-            payload.update({"max_bytes": max_bytes, "limit": max_bytes})
-        return await self._call_tool_flex("read_file", payload)
+        return await self._call_tool_flex("read_file", {"path": path, "max_bytes": max_bytes, "limit": max_bytes})
+
+    async def iter_file(self, path: str, chunk: int = 65536) -> AsyncIterator[str]:
+        """
+        Yield a file's content in chunks of about `chunk` units.
+        If read_file accepts an offset + size limit, each chunk is a separate ranged read, so the
+        caller can start working before the whole file has crossed the session. Offsets follow the
+        schema's unit: byte-based params (byte_offset / max_bytes) advance by the UTF-8 length and stop
+        on an empty read (a server may cut a chunk short at a character boundary); character-based
+        params advance by len(text) and stop on a short read.
+        Otherwise falls back to one full read sliced locally.
+        """
+        if not self._tools_index:
+            await self._refresh_tools_index()
+        plan = self._param_plans.get("read_file")
+        keys = plan[0] if plan else frozenset()
+        offset_key = next((k for k in _SYNONYMS["offset"] if k in keys), None)
+        size_key = next((k for k in (*_SYNONYMS["max_bytes"], "limit") if k in keys), None)
+        if offset_key is None or size_key is None:
+            text = self._result_text(await self.read_file(path))
+            for i in range(0, len(text), chunk):
+                yield text[i:i + chunk]
+            return
+        by_bytes = offset_key == "byte_offset" or size_key == "max_bytes"
+        offset = 0
+        while True:
+            res = await self._call_tool_flex(
+                "read_file", {"path": path, offset_key: offset, size_key: chunk}
+            )
+            text = self._result_text(res)
+            if not text:
+                return
+            yield text
+            if by_bytes:
+                offset += len(text.encode("utf-8"))
+                continue
+            if len(text) < chunk:
+                return
+            offset += len(text)
+
+    @staticmethod
+    def _result_text(res: Dict[str, Any]) -> str:
+        out = res.get("result")
+        return out if isinstance(out, str) else ("" if out is None else str(out))
+
+    async def create_text_file(self, path: str, content: str) -> Dict[str, Any]:
+        """Ghi đè toàn bộ nội dung file (1 round-trip thay cho nhiều replace nhỏ)."""
+        return await self._call_tool_flex(
+            "create_text_file", {"relative_path": path, "content": content}
+        )
 
     async def insert_after_symbol(
         self, name_path: str, relative_path: str, text: str
     ) -> Dict[str, Any]:
         return await self._call_tool_flex(
             "insert_after_symbol",
-            {
-                "name_path": name_path,
-                "relative_path": relative_path,
-                "path": relative_path,
-                "file": relative_path,
-                "text": text,
-                "new_text": text,
-            },
+            {"name_path": name_path, "relative_path": relative_path, "text": text},
         )
 
     async def insert_before_symbol(
@@ -270,52 +487,75 @@ class SerenaClient:
     ) -> Dict[str, Any]:
         return await self._call_tool_flex(
             "insert_before_symbol",
+            {"name_path": name_path, "relative_path": relative_path, "text": text},
+        )
+
+    async def find_referencing_symbols(
+        self,
+        name_path: str,
+        relative_path: str,
+        include_definitions: Optional[bool] = None,
+        kinds: Optional[List[str]] = None,
+        max_results: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Find locations that reference a given symbol. Helpful for impact analysis before/after edits.
+        """
+        return await self._call_tool_flex(
+            "find_referencing_symbols",
             {
                 "name_path": name_path,
                 "relative_path": relative_path,
-                "path": relative_path,
-                "file": relative_path,
-                "text": text,
-                "new_text": text,
+                "include_definitions": include_definitions,
+                "kinds": kinds or None,
+                "limit": max_results,
             },
         )
 
-    async def find_referencing_symbols(
+    async def find_referencing_symbols_batch(self, items: List[Dict[str, Any]]) -> List[Any]:
+        """
+        References of many symbols at once; each item holds find_referencing_symbols kwargs.
+        Fans out concurrently and always returns one result per item, in order (a failing item
+        yields its exception, like call_many). For a single array call see find_referencing_symbols_multi.
+        """
+        if not items:
+            return []
+        return await asyncio.gather(
+            *(self.find_referencing_symbols(**i) for i in items),
+            return_exceptions=True,
+        )
+
+    async def supports_name_paths(self) -> bool:
+        """True if find_referencing_symbols accepts an array of symbols (`name_paths`) in one call."""
+        if not self._tools_index:
+            await self._refresh_tools_index()
+        schema = self._tools_index.get("find_referencing_symbols", {}).get("inputSchema") or {}
+        return "name_paths" in (schema.get("properties") or {})
+
+    async def find_referencing_symbols_multi(
         self,
-        name_path: str,
+        name_paths: List[str],
         relative_path: str,
         include_definitions: Optional[bool] = None,
         kinds: Optional[List[str]] = None,
         max_results: Optional[int] = None,
     ) -> Dict[str, Any]:
         """
-        Find locations that reference a given symbol. Helpful for impact analysis before/after edits.
+        References of several symbols in one file with a single tool call (server must expose
+        `name_paths`, see supports_name_paths). Returns the server's combined result as-is.
         """
-        payload: Dict[str, Any] = {
-            "name_path": name_path,
-            "relative_path": relative_path,
-            "path": relative_path,
-            "file": relative_path,
-        }
-        if include_definitions is not None:
-            payload.update({
+        if not await self.supports_name_paths():
+            raise SerenaError("find_referencing_symbols does not accept 'name_paths' on this server")
+        return await self._call_tool_flex(
+            "find_referencing_symbols",
+            {
+                "name_paths": list(name_paths),
+                "relative_path": relative_path,
                 "include_definitions": include_definitions,
-                "include_defs": include_definitions,
-                "with_definitions": include_definitions,
-            })
-        if kinds:
-            payload.update({
-                "kinds": kinds,
-                "symbol_kinds": kinds,
-                "symbolKinds": kinds,
-                "types": kinds,
-            })
-        if max_results is not None:
-            payload.update({
-                "max_results": max_results,
+                "kinds": kinds or None,
                 "limit": max_results,
-            })
-        return await self._call_tool_flex("find_referencing_symbols", payload)
+            },
+        )
 
     async def execute_shell_command(
         self,
@@ -331,31 +571,11 @@ class SerenaClient:
         """
         payload: Dict[str, Any] = {
             "command": command,
-            "cmd": command,
-            "shell_command": command,
-            "sh": command,
-            "bash": command,
+            "cwd": cwd or None,
+            "env": env or None,
+            "shell": shell,
+            "timeout": timeout_s,
         }
-        if cwd:
-            payload.update({
-                "cwd": cwd,
-                "workdir": cwd,
-                "working_directory": cwd,
-                "dir": cwd,
-            })
-        if env:
-            payload.update({
-                "env": env,
-                "environment": env,
-            })
-        if shell is not None:
-            payload.update({"shell": shell})
-        if timeout_s is not None:
-            payload.update({
-                "timeout": timeout_s,
-                "timeout_s": timeout_s,
-                "seconds": timeout_s,
-            })
 
         # Default longer timeout for tool call (command itself may run long)
         call_timeout = max(timeout_s or 120, 120)
@@ -379,8 +599,10 @@ class SerenaClient:
         """
         assert self._session is not None
 
-        if tool not in self._tools_index:
+        if tool not in self._tools_index and tool not in self._missing_tools:
             await self._refresh_tools_index()
+            if tool not in self._tools_index:
+                self._missing_tools.add(tool)
         if tool not in self._tools_index:
             msg = f"Tool '{tool}' not exposed by Serena."
             if must_exist:
@@ -392,8 +614,8 @@ class SerenaClient:
         properties: Dict[str, Any] = schema.get("properties") or {}
         required: List[str] = schema.get("required") or []
 
-        # Build param map respecting schema keys; allow synonyms
-        params = self._map_params(properties, candidate_params)
+        # Build param map respecting schema keys; allow synonyms (plan dựng sẵn lúc tools/list)
+        params = self._map_params(self._param_plans.get(tool), candidate_params)
 
         # Check required keys — if missing, attach debug info
         missing = [k for k in required if k not in params]
@@ -404,92 +626,115 @@ class SerenaClient:
                 f"Schema props: {list(properties.keys())}"
             )
 
+        path = next((candidate_params[k] for k in _PATH_KEYS if candidate_params.get(k)), None)
+        cache_key = self._cache_key(tool, params, path)
+        if cache_key is not None:
+            hit = self._tool_cache.get(cache_key)
+            if hit is not None:
+                if hit[0] > time.monotonic():
+                    self._tool_cache.move_to_end(cache_key)
+                    return hit[1]
+                del self._tool_cache[cache_key]
+
         try:
             result = await asyncio.wait_for(
                 self._session.call_tool(tool, params),
                 timeout=timeout_s,
             )
         except asyncio.TimeoutError as e:
+            self.healthy = False
             raise SerenaError(f"Timeout calling tool '{tool}'") from e
+        finally:
+            # tool ghi (kể cả khi lỗi/timeout, file có thể đã đổi) → vô hiệu cache liên quan
+            if cache_key is None and tool not in _FILE_SCOPED_READS and tool not in _PROJECT_SCOPED_READS:
+                self._invalidate(tool, path)
 
         payload = getattr(result, "content", None)
+        out: Dict[str, Any] = {"ok": True, "tool": tool, "raw": getattr(result, "__dict__", {})}
         if isinstance(payload, list) and payload:
             first = payload[0]
             if hasattr(first, "text") and first.text is not None:
-                return {"ok": True, "tool": tool, "result": first.text}
-            if hasattr(first, "json") and first.json is not None:
-                return {"ok": True, "tool": tool, "result": first.json}
-        return {"ok": True, "tool": tool, "raw": getattr(result, "__dict__", {})}
+                out = {"ok": True, "tool": tool, "result": first.text}
+            elif hasattr(first, "json") and first.json is not None:
+                out = {"ok": True, "tool": tool, "result": first.json}
+
+        if cache_key is not None:
+            self._tool_cache[cache_key] = (time.monotonic() + _TOOL_CACHE_TTL_S, out)
+            if len(self._tool_cache) > _TOOL_CACHE_MAX:
+                self._tool_cache.popitem(last=False)
+        return out
+
+    def _cache_key(self, tool: str, params: Dict[str, Any], path: Optional[str]) -> Optional[Tuple[Any, ...]]:
+        """Key cache cho tool chỉ đọc; None nếu tool không cache được."""
+        if tool in _FILE_SCOPED_READS and path:
+            version: Tuple[Any, ...] = (path, self._file_version.get(path, 0), self._write_gen)
+        elif tool in _PROJECT_SCOPED_READS:
+            version = (self._project_gen, self._write_gen)
+        else:
+            return None
+        try:
+            frozen = orjson.dumps(params, option=orjson.OPT_SORT_KEYS, default=str)
+        except (TypeError, ValueError):
+            return None
+        return (tool, frozen, version)
+
+    def invalidate(self) -> None:
+        """Bỏ toàn bộ cache đọc (gọi khi file bị sửa ngoài Serena)."""
+        self._write_gen += 1
+        self._tool_cache.clear()
+
+    def _invalidate(self, tool: str, path: Optional[str]) -> None:
+        # entry cũ không còn khớp key (version đã đổi) → tự bị đẩy ra theo LRU
+        if tool in _PATH_WRITES and path:
+            self._file_version[path] = self._file_version.get(path, 0) + 1
+            self._project_gen += 1  # read theo project có thể chứa file vừa sửa
+        else:
+            # exec / tool ghi không rõ phạm vi → bỏ toàn bộ
+            self.invalidate()
+
+    @staticmethod
+    def _build_param_plan(schema_props: Dict[str, Any]) -> Optional[ParamPlan]:
+        """
+        Precompute how friendly keys map onto one tool's schema (built once per tools/list).
+        Returns None when the schema declares no properties (→ pass everything).
+        """
+        if not schema_props:
+            return None
+        schema_keys = frozenset(schema_props)
+        groups = []
+        for aliases in _SYNONYMS.values():
+            in_schema = tuple(a for a in aliases if a in schema_keys)
+            # group không có key nào trong schema → không bao giờ ghi gì, bỏ qua
+            if in_schema:
+                # tên group luôn đứng đầu alias list → key đích là alias đầu tiên có trong schema
+                groups.append((aliases, in_schema, in_schema[0]))
+        return schema_keys, tuple(groups)
 
     @staticmethod
     def _map_params(
-        schema_props: Dict[str, Any],
+        plan: Optional[ParamPlan],
         candidates: Dict[str, Any],
     ) -> Dict[str, Any]:
         """
         Map friendly keys to the exact keys expected by the tool schema.
         We keep only keys present in schema; if schema empty → pass everything.
         """
-        if not schema_props:
+        if plan is None:
             return {k: v for k, v in candidates.items() if v is not None}
 
-        schema_keys = set(schema_props.keys())
-        out: Dict[str, Any] = {}
-
-        synonyms: Dict[str, List[str]] = {
-            # file-ish
-            "path": ["path", "file", "file_path", "filepath", "relative_path"],
-            "name_path": ["name_path", "symbol", "symbol_path", "qualified_name"],
-            # search/replace
-            "pattern": ["pattern", "regex", "regexp"],
-            "replacement": ["replacement", "with", "new_text", "text"],
-            "new_body": ["new_body", "body", "text"],
-            "start": ["start", "start_line", "from_line", "line_start"],
-            "end": ["end", "end_line", "to_line", "line_end"],
-            # limits/counts
-            "max_matches": ["max_matches", "limit"],
-            "max_results": ["max_results", "limit"],
-            "count": ["count", "max_replacements"],
-            "flags": ["flags"],
-            # referencing symbols / options
-            "include_definitions": ["include_definitions", "include_defs", "with_definitions"],
-            "kinds": ["kinds", "symbol_kinds", "symbolKinds", "types"],
-            # shell exec
-            "command": ["command", "cmd", "shell_command", "sh", "bash"],
-            "cwd": ["cwd", "workdir", "working_directory", "dir"],
-            "env": ["env", "environment"],
-            "shell": ["shell"],
-            "timeout": ["timeout", "timeout_s", "seconds"],
-        }
-
+        schema_keys, groups = plan
         # Direct matches first
-        for k, v in candidates.items():
-            if k in schema_keys and v is not None:
-                out[k] = v
+        out: Dict[str, Any] = {k: v for k, v in candidates.items() if k in schema_keys and v is not None}
 
         # Synonym mapping
-        for group, alias_list in synonyms.items():
-            value = None
-            for a in alias_list:
-                if a in candidates and candidates[a] is not None:
-                    value = candidates[a]
-                    break
-            if value is None:
-                continue
-
-            # If any alias already matched directly, skip
-            already = any((a in out) for a in alias_list)
-            if already:
+        for aliases, in_schema, target in groups:
+            # If any alias already matched (directly or via an earlier group), skip
+            if any(a in out for a in in_schema):
                 continue
-
-            # Find schema key within this group
-            for a in alias_list:
-                if a in schema_keys and a not in out:
-                    out[a] = value
+            for a in aliases:
+                v = candidates.get(a)
+                if v is not None:
+                    out[target] = v
                     break
 
-            # Or the group name itself
-            if group in schema_keys and group not in out:
-                out[group] = value
-
-        return out
\ No newline at end of file
+        return out
@@ -1,28 +1,52 @@
+import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from src.app.api.routers import fixer_rag, scanner_rag
+from fastapi.responses import ORJSONResponse
 
-app = FastAPI(title="FixChain API", version="1.0.0")
+def _env_flag(name: str, default: str = "1") -> bool:
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+# Tắt docs (FIXCHAIN_ENABLE_DOCS=0, ví dụ ở prod) → không dựng OpenAPI schema cho toàn bộ model
+_docs = _env_flag("FIXCHAIN_ENABLE_DOCS")
+
+app = FastAPI(
+    title="FixChain API",
+    version="1.0.0",
+    openapi_url="/openapi.json" if _docs else None,
+    docs_url="/docs" if _docs else None,
+    redoc_url="/redoc" if _docs else None,
+    # orjson serialize response nhanh hơn json stdlib nhiều lần với list dict lớn (search/import)
+    default_response_class=ORJSONResponse,
+)
+
+# Origin cụ thể (FIXCHAIN_CORS, phân tách bằng dấu phẩy) thay cho "*": Starlette so khớp danh sách tĩnh
+# và browser được cache preflight (max_age) → bớt request OPTIONS
+_cors_origins = [o.strip() for o in os.getenv("FIXCHAIN_CORS", "http://localhost:3000").split(",") if o.strip()]
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=_cors_origins,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "PUT", "DELETE"],
+    allow_headers=["Authorization", "Content-Type"],
+    max_age=86400,
 )
 
-# Prefix mới, tên dễ hiểu
-app.include_router(fixer_rag,   prefix="/api/v1/fixer-rag",    tags=["Fixer RAG"])
-app.include_router(scanner_rag,  prefix="/api/v1/scanner-rag",  tags=["Scanner RAG"])
+# Prefix mới, tên dễ hiểu. Router nào bị tắt thì module (và client embedding/Mongo) không được import.
+_services = {}
+if _env_flag("FIXCHAIN_ENABLE_FIXER_RAG"):
+    from src.app.api.routers import fixer_rag
+    app.include_router(fixer_rag,   prefix="/api/v1/fixer-rag",    tags=["Fixer RAG"])
+    _services["Fixer RAG"] = "/api/v1/fixer-rag"
+if _env_flag("FIXCHAIN_ENABLE_SCANNER_RAG"):
+    from src.app.api.routers import scanner_rag
+    app.include_router(scanner_rag,  prefix="/api/v1/scanner-rag",  tags=["Scanner RAG"])
+    _services["Scanner RAG"] = "/api/v1/scanner-rag"
 
 @app.get("/")
 def root():
     return {
         "message": "Welcome to FixChain",
-        "services": {
-            "Fixer RAG": "/api/v1/fixer-rag",
-            "Scanner RAG": "/api/v1/scanner-rag",
-        },
-        "docs": "/docs",
-    }
\ No newline at end of file
+        "services": _services,
+        "docs": "/docs" if _docs else None,
+    }
@@ -1,3 +1,20 @@
-from .fixer_rag_router import router as fixer_rag
-from .scanner_rag_router import router as scanner_rag
-__all__ = ["scanner_rag_router", "fixer_rag_router"]
\ No newline at end of file
+import importlib
+
+# Import lazy (PEP 562): router chỉ được load khi được truy cập lần đầu,
+# nên router bị tắt trong main.py không kéo theo Mongo/Gemini lúc khởi động.
+_LAZY = {
+    "fixer_rag": "fixer_rag_router",
+    "scanner_rag": "scanner_rag_router",
+}
+
+def __getattr__(name):
+    if name in _LAZY:
+        router = importlib.import_module(f"{__name__}.{_LAZY[name]}").router
+        globals()[name] = router
+        return router
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted([*globals(), *_LAZY])
+
+__all__ = ["fixer_rag", "scanner_rag"]
@@ -7,22 +7,40 @@ Fixer RAG router
 - /fix
 - /suggest-fix
 """
+import asyncio
 import json
 import os
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Set, Tuple
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from dotenv import load_dotenv
 from src.app.adapters.llm.google_genai import client, EMBEDDING_MODEL
 from src.app.repositories.mongo import get_mongo_manager
 from src.app.repositories.mongo_utlis import ensure_collection
+from src.app.services.embedding_cache import (
+    content_hash,
+    get_cached_search,
+    get_query_embedding,
+    invalidate_search_cache,
+    put_cached_search,
+    stored_content_hashes,
+)
 from src.app.services.log_service import logger
 
 root_env_path = Path(__file__).resolve().parents[4] / '.env'
 load_dotenv(root_env_path)
 
 FIXER_COLLECTION = os.getenv("FIXER_RAG_COLLECTION", "fixer_rag_collection")
+# Import chạy dạng pipeline: mỗi lô _IMPORT_CHUNK bug = 1 lời gọi embed_content + 1 bulk_write.
+# _EMBED_WORKERS lô embed (Gemini) chạy song song với _WRITE_WORKERS lô ghi Mongo;
+# hàng đợi giữa 2 bên chặn ở _IMPORT_QUEUE lô đã embed chưa ghi.
+_IMPORT_CHUNK = 50
+_EMBED_WORKERS = 3
+_WRITE_WORKERS = 2
+_IMPORT_QUEUE = 4
 
 class BugSearchRequest(BaseModel):
     query: str
@@ -42,9 +60,64 @@ def generate_gemini_embedding(text: str) -> List[float]:
     else:
         return res_embeddings[0].values
 
+def generate_gemini_embeddings_batch(texts: List[str]) -> List[List[float]]:
+    """Embed nhiều text trong 1 lời gọi embed_content; kết quả theo đúng thứ tự texts."""
+    res = client.models.embed_content(model=EMBEDDING_MODEL, contents=texts)
+    res_embeddings = getattr(res, "embeddings", None) or []
+    if len(res_embeddings) != len(texts):
+        raise RuntimeError(f"Expected {len(texts)} embeddings, got {len(res_embeddings)}")
+    return [e.values for e in res_embeddings]
+
+async def _embed_chunk(texts: List[str]) -> List[List[float]]:
+    try:
+        return await asyncio.to_thread(generate_gemini_embeddings_batch, texts)
+    except Exception as e:
+        logger.warning("Batch embedding failed for %d bugs: %s; fallback empty embedding", len(texts), e)
+        return [[] for _ in texts]
+
+def _write_chunk(
+    collection,
+    idx: List[int],
+    bugs: List[Dict[str, Any]],
+    embeddings: List[Optional[List[float]]],
+    hashes: List[str],
+) -> Tuple[Set[int], Dict[int, str]]:
+    """
+    Upsert 1 lô bằng 1 bulk_write (ordered=False); trả (index upserted, index lỗi → errmsg) theo index toàn cục
+    (idx[i] = vị trí trong request của bugs[i]).
+    embedding None = content_hash trùng bản đã lưu → không $set embedding, giữ embedding cũ.
+    """
+    ops: List[UpdateOne] = []
+    for bug, embedding, h in zip(bugs, embeddings, hashes):
+        meta = bug.get("metadata") or {}
+        if not isinstance(meta, dict):
+            meta = {}
+        doc: Dict[str, Any] = {
+            "content": bug,
+            "metadata": meta,
+        }
+        if embedding is not None:
+            doc["embedding"] = embedding
+            # embed lỗi (rỗng) → không lưu hash để lần import sau embed lại
+            doc["content_hash"] = h if embedding else None
+        ops.append(UpdateOne({"doc_id": bug["doc_id"]}, {"$set": doc}, upsert=True))
+
+    failed: Dict[int, str] = {}
+    try:
+        details = collection.bulk_write(ops, ordered=False).bulk_api_result
+    except BulkWriteError as e:
+        details = e.details
+        failed = {idx[err["index"]]: err.get("errmsg", "") for err in details.get("writeErrors", [])}
+    except Exception as e:
+        # lỗi cả lô (mất kết nối...) → đánh dấu từng bug, không làm hỏng các lô khác
+        return set(), {i: str(e) for i in idx}
+    return {idx[u["index"]] for u in details.get("upserted", [])}, failed
+
 router = APIRouter()
+# Route chỉ gọi PyMongo/Gemini (blocking) khai báo `def` → FastAPI chạy trong threadpool,
+# không chặn event loop. /import giữ async vì tự điều phối pipeline, phần blocking đưa qua to_thread.
 @router.get("/health")
-async def health_check():
+def health_check():
     """
     Kiểm tra & tự tạo collection cho Fixer RAG nếu chưa có.
     """
@@ -61,60 +134,101 @@ async def health_check():
 @router.post("/import")
 async def import_bugs_as_rag(bugs: List[Dict[str, Any]]):
     try:
-        mongo_manager = get_mongo_manager()
-        collection = mongo_manager.collection(FIXER_COLLECTION)
-        try:
-            collection.create_index("doc_id", unique=True)
-        except Exception:
-            pass
+        # lần đầu get_mongo_manager() còn ping + tạo index → không chạy trên event loop.
+        # Index unique doc_id đã do MongoDBManager._ensure_indexes tạo, không cần create_index mỗi request
+        collection = await asyncio.to_thread(lambda: get_mongo_manager().collection(FIXER_COLLECTION))
 
-        imported: List[Dict[str, Any]] = []
-        for idx, bug in enumerate(bugs):
+        for bug in bugs:
             if not isinstance(bug, dict):
                 raise ValueError("Each bug item must be a JSON object")
-            doc_id = bug.get("doc_id")
-            if not doc_id:
+            if not bug.get("doc_id"):
                 raise ValueError("Missing 'doc_id' in bug item")
-            
-            logger.debug("Import #%d: doc_id=%s", idx, doc_id)
-            meta = bug.get("metadata") or {}
-            if not isinstance(meta, dict):
-                meta = {}
-            emb_text = json.dumps(bug, ensure_ascii=False)
-            try:
-                embedding = generate_gemini_embedding(emb_text)
-            except Exception as e:
-                logger.warning("Embedding failed for %s: %s; fallback empty embedding", doc_id, e)
-                embedding = []
-
-            doc = {
-                "content": bug,
-                "metadata": meta,
-                "embedding": embedding,
-            }
-
-            result = collection.update_one({"doc_id": doc_id}, {"$set": doc}, upsert=True)
-
-            status = "inserted" if result.upserted_id is not None else ("updated" if result.modified_count else "unchanged")
-            imported.append({"bug_id": doc_id, "status": status})
+
+        # doc_id lặp trong 1 request → chỉ ghi bản cuối (như vòng lặp tuần tự trước đây: bản sau đè bản trước).
+        # Nếu không, 2 writer có thể upsert cùng doc_id song song và 1 op dính E11000 trên index unique
+        last: Dict[Any, int] = {bug["doc_id"]: i for i, bug in enumerate(bugs)}
+        unique = sorted(last.values())
+        todo: "asyncio.Queue[Tuple[List[int], List[Dict[str, Any]]]]" = asyncio.Queue()
+        for pos in range(0, len(unique), _IMPORT_CHUNK):
+            idx = unique[pos:pos + _IMPORT_CHUNK]
+            todo.put_nowait((idx, [bugs[i] for i in idx]))
+        ready: asyncio.Queue = asyncio.Queue(maxsize=_IMPORT_QUEUE)
+        upserted: Set[int] = set()
+        # content_hash trùng bản đã lưu (hash phủ cả JSON bug) → báo "unchanged" như trước
+        unchanged: Set[int] = set()
+        failed: Dict[int, str] = {}
+
+        async def embedder() -> None:
+            while not todo.empty():
+                idx, chunk = todo.get_nowait()
+                texts = [json.dumps(bug, ensure_ascii=False) for bug in chunk]
+                hashes = [content_hash(t) for t in texts]
+                # re-import bug không đổi → giữ embedding đã lưu, chỉ gửi Gemini phần đã đổi/mới
+                stored = await asyncio.to_thread(
+                    stored_content_hashes, collection, "doc_id", [bug["doc_id"] for bug in chunk]
+                )
+                changed = [i for i, bug in enumerate(chunk) if stored.get(bug["doc_id"]) != hashes[i]]
+                logger.debug("Import chunk @%d: %d bugs, %d to embed", idx[0], len(chunk), len(changed))
+                embeddings: List[Optional[List[float]]] = [None] * len(chunk)
+                if changed:
+                    for i, emb in zip(changed, await _embed_chunk([texts[i] for i in changed])):
+                        embeddings[i] = emb
+                unchanged.update(idx[i] for i, emb in enumerate(embeddings) if emb is None)
+                await ready.put((idx, chunk, embeddings, hashes))
+
+        async def writer() -> None:
+            while (item := await ready.get()) is not None:
+                up, fail = await asyncio.to_thread(_write_chunk, collection, *item)
+                upserted.update(up)
+                failed.update(fail)
+
+        # ghi lô trước trong lúc lô sau còn đang embed → tổng thời gian ~ max(embed, ghi) thay vì tổng
+        writers = [asyncio.create_task(writer()) for _ in range(_WRITE_WORKERS)]
+        try:
+            await asyncio.gather(*(embedder() for _ in range(min(_EMBED_WORKERS, todo.qsize()))))
+        finally:
+            for _ in writers:
+                await ready.put(None)
+            await asyncio.gather(*writers)
+            invalidate_search_cache(FIXER_COLLECTION)
+
+        imported: List[Dict[str, Any]] = []
+        failed_count = 0
+        for bug in bugs:
+            # bản trùng doc_id nhận status của bản đã ghi (bản cuối)
+            idx = last[bug["doc_id"]]
+            if idx in failed:
+                failed_count += 1
+                imported.append({"bug_id": bug["doc_id"], "status": "failed", "error": failed[idx]})
+            elif idx in upserted:
+                imported.append({"bug_id": bug["doc_id"], "status": "inserted"})
+            else:
+                imported.append({"bug_id": bug["doc_id"], "status": "unchanged" if idx in unchanged else "updated"})
         return {
             "imported_bugs": imported,
-            "message": f"Successfully imported {len(imported)} bugs as RAG documents",
+            "message": f"Successfully imported {len(imported) - failed_count} bugs as RAG documents",
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error importing bugs: {str(e)}")
 
 @router.post("/search", response_model=SearchResponse)
-async def search_fixers(req: BugSearchRequest):
+def search_fixers(req: BugSearchRequest):
     try:
+        emb = get_query_embedding(req.query, generate_gemini_embedding)
+        cached = get_cached_search(FIXER_COLLECTION, req.filters, req.top_k, emb)
+        if cached is not None:
+            return {"query": req.query, "sources": cached}
         mongo_manager = get_mongo_manager()
-        emb = generate_gemini_embedding(req.query)
         results = mongo_manager.search_by_embedding(
             query_embedding=emb,
             top_k=int(req.top_k),
             collection_name=FIXER_COLLECTION,
             filters=req.filters or {},
-        )
-        return {"query": req.query, "sources": results or []}
+        ) or []
+        put_cached_search(FIXER_COLLECTION, req.filters, req.top_k, emb, results)
+        return {"query": req.query, "sources": results}
+    except ValueError as e:
+        # filter không hợp lệ (key lạ / toán tử Mongo) → lỗi của request
+        raise HTTPException(status_code=400, detail=f"Invalid search filters: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error during fixer search: {str(e)}")
\ No newline at end of file
@@ -1,4 +1,7 @@
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import random
+import time
 import uuid
 from dotenv import load_dotenv
 from fastapi import APIRouter, HTTPException
@@ -7,15 +10,29 @@ from typing import List, Literal, Optional, Dict, Any
 import os
 from pymongo.errors import BulkWriteError
 from pymongo import UpdateOne
+from google.genai import errors as genai_errors
 from src.app.repositories.mongo import get_mongo_manager
+from src.app.services.log_service import logger
 from src.app.repositories.mongo_utlis import ensure_collection
 from src.app.adapters.llm.google_genai import client, EMBEDDING_MODEL
+from src.app.services.embedding_cache import (
+    content_hash,
+    get_cached_search,
+    get_query_embedding,
+    invalidate_search_cache,
+    put_cached_search,
+    stored_content_hashes,
+)
 
 root_env_path = Path(__file__).resolve().parents[4] / '.env'
 load_dotenv(root_env_path)
 
 router = APIRouter()
 SCANNER_COLLECTION = os.getenv("SCANNER_RAG_COLLECTION", "scanner_rag_collection")
+# Số content tối đa mỗi lời gọi embed_content khi import/upsert
+_EMBED_BATCH = int(os.getenv("SCANNER_EMBED_BATCH", "100"))
+# Số lô embed gửi song song tối đa (import lớn có nhiều lô)
+_EMBED_CONCURRENCY = max(1, int(os.getenv("SCANNER_EMBED_CONCURRENCY", "4")))
 
 class ScannerSignalIn(BaseModel):
     key: str
@@ -72,14 +89,16 @@ class ScannerUpdateRequest(BaseModel):
 
 def _compose_content(it: Dict[str, Any]) -> str:
     """Ghép nội dung để embed từ shape B (không nhận shape A)."""
-    title = (it.get("title") or "").strip()
-    desc = (it.get("description") or "").strip()
-    code = (it.get("code_snippet") or "").strip()
-    loc = ""
-    if it.get("file_name"):
-        loc = f"{it.get('file_name')}:{it.get('line_number')}" if it.get("line_number") is not None else it.get("file_name")
-    parts = [p for p in (title, desc, loc, code) if p]
-    return "\n".join(parts)[:16000]  # giới hạn an toàn
+    file_name = it.get("file_name")
+    line_number = it.get("line_number")
+    loc = (f"{file_name}:{line_number}" if line_number is not None else file_name) if file_name else ""
+    parts = (
+        (it.get("title") or "").strip(),
+        (it.get("description") or "").strip(),
+        loc,
+        (it.get("code_snippet") or "").strip(),
+    )
+    return "\n".join(p for p in parts if p)[:16000]  # giới hạn an toàn
 
 def _embed_text(text: str) -> List[float]:
     embedding = client.models.embed_content(model=EMBEDDING_MODEL, contents=text)
@@ -88,8 +107,75 @@ def _embed_text(text: str) -> List[float]:
         raise RuntimeError("No embeddings returned from Gemini API")
     return r_embeddings[0].values
 
+def _embed_chunk(texts: List[str]) -> List[List[float]]:
+    """
+    1 lời gọi embed_content cho cả lô. Chỉ embed lại từng text khi lô lệch số lượng/shape
+    (thiếu kết quả, hoặc API từ chối lô với 400); lỗi auth / rate limit / server được raise
+    luôn thay vì nhân số lời gọi lên cùng một quota đang lỗi.
+    """
+    try:
+        res = client.models.embed_content(model=EMBEDDING_MODEL, contents=texts)
+    except genai_errors.APIError as e:
+        if e.code != 400:
+            raise
+        logger.warning("Batch embedding rejected for %d texts; embedding one by one", len(texts), exc_info=True)
+        return [_embed_text(t) for t in texts]
+    r_embeddings = getattr(res, "embeddings", None) or []
+    if len(r_embeddings) == len(texts) and all(r_embeddings):
+        return [e.values for e in r_embeddings]
+    logger.warning("Batch embedding returned %d/%d embeddings; embedding one by one", len(r_embeddings), len(texts))
+    return [_embed_text(t) for t in texts]
+
+def _embed_chunk_jittered(texts: List[str]) -> List[List[float]]:
+    # giãn nhẹ thời điểm gửi để các lô song song không dồn cùng lúc vào rate limit
+    time.sleep(random.random() * 0.05)
+    return _embed_chunk(texts)
+
+def _embed_texts(texts: List[str]) -> List[List[float]]:
+    """
+    Embed theo lô _EMBED_BATCH text / lời gọi, kết quả theo đúng thứ tự texts.
+    Nhiều lô → gửi song song tối đa _EMBED_CONCURRENCY lô (route sync chạy trong threadpool).
+    """
+    chunks = [texts[i:i + _EMBED_BATCH] for i in range(0, len(texts), _EMBED_BATCH)]
+    if len(chunks) <= 1:
+        return _embed_chunk(chunks[0]) if chunks else []
+    with ThreadPoolExecutor(max_workers=min(_EMBED_CONCURRENCY, len(chunks))) as ex:
+        # map giữ đúng thứ tự lô → ghép lại theo offset ban đầu
+        return [emb for chunk in ex.map(_embed_chunk_jittered, chunks) for emb in chunk]
+
+def _signal_docs(col, items: List[ScannerSignalIn], match_field: str = "key") -> List[Dict[str, Any]]:
+    """
+    Dựng document (content + embedding + metadata) cho các signal có content; signal rỗng bị bỏ.
+    Signal đã có trong collection (tra theo match_field = field lọc của upsert) với cùng content_hash
+    (re-import) → không embed lại, document không mang field embedding nên $set giữ nguyên embedding đang lưu.
+    """
+    # đọc thẳng field của model, không dump cả model ra dict mới chỉ để ghép content
+    pending = [(it, content, content_hash(content)) for it in items if (content := _compose_content(vars(it)))]
+    stored = stored_content_hashes(col, match_field, (it.key for it, _, _ in pending))
+    changed = [content for it, content, h in pending if stored.get(it.key) != h]
+    embeddings = iter(_embed_texts(changed))
+    docs = []
+    for it, content, h in pending:
+        doc: Dict[str, Any] = {"key": it.key, "content": content}
+        if stored.get(it.key) != h:
+            emb = next(embeddings)
+            doc.update(embedding=emb, embedding_dimension=len(emb), content_hash=h)
+        doc["metadata"] = {
+            "id": it.id,
+            "title": it.title,
+            "description": it.description,
+            "code_snippet": it.code_snippet,
+            "file_name": it.file_name,
+            "line_number": it.line_number,
+            "severity": it.severity,
+            "tags": it.tags or [],
+            "source": it.source or "bearer",
+        }
+        docs.append(doc)
+    return docs
+
 @router.get("/health")
-async def health():
+def health():
     """
     Kiểm tra & tự tạo collection cho Scanner RAG nếu chưa có.
     """
@@ -115,30 +201,8 @@ def import_signals(items: List[ScannerSignalIn]):
     docs = []
     ids = []
 
-    for it in items:
-        d = it.dict()
-        content = _compose_content(d)
-        if not content:
-            continue
-        emb = _embed_text(content)
-        doc = {
-            "key": it.key,
-            "content": content,
-            "embedding": emb,
-            "embedding_dimension": len(emb),
-            "metadata": {
-                "id": it.id,
-                "title": it.title,
-                "description": it.description,
-                "code_snippet": it.code_snippet,
-                "file_name": it.file_name,
-                "line_number": it.line_number,
-                "severity": it.severity,
-                "tags": it.tags or [],
-                "source": it.source or "bearer",
-            }
-        }
-
+    # /import upsert theo doc_id (= key) → tra hash theo doc_id cho khớp đúng document sẽ bị $set
+    for doc in _signal_docs(col, items, match_field="doc_id"):
         doc_id = (doc.get("key") or str(uuid.uuid4()))
         doc["doc_id"] = str(doc_id)
         docs.append(
@@ -155,6 +219,7 @@ def import_signals(items: List[ScannerSignalIn]):
     
     try:
         res = col.bulk_write(docs, ordered=False)
+        invalidate_search_cache(SCANNER_COLLECTION)
         inserted = (res.upserted_count or 0) + (res.inserted_count or 0)
         return {"success": True, "inserted": inserted, "ids": ids}
     except BulkWriteError as e:
@@ -168,19 +233,6 @@ def update_scanner_signal(req: ScannerUpdateRequest):
     mm = get_mongo_manager()
     col = mm.collection(SCANNER_COLLECTION)
 
-    existing = col.find_one({"key": req.key})
-    if not existing:
-        raise HTTPException(status_code=404, detail=f"Signal not found for key={req.key}")
-    
-    meta = existing.get("metadata", {}) or {}
-    merged = {
-        "title": req.patch.title if req.patch.title is not None else meta.get("title", ""),
-        "description": req.patch.description if req.patch.description is not None else meta.get("description", ""),
-        "code_snippet": req.patch.code_snippet if req.patch.code_snippet is not None else meta.get("code_snippet", ""),
-        "file_name": req.patch.file_name if req.patch.file_name is not None else meta.get("file_name"),
-        "line_number": req.patch.line_number if req.patch.line_number is not None else meta.get("line_number"),
-    }
-
     must_reembed = any(
         v is not None for v in (req.patch.title, req.patch.description, req.patch.code_snippet, req.patch.file_name, req.patch.line_number)
     )
@@ -201,15 +253,44 @@ def update_scanner_signal(req: ScannerUpdateRequest):
         if val is not None:
             update_set[f"{f}"] = val
 
-    # nếu có thay đổi thành phần content -> re-embed
+    # nếu có thay đổi thành phần content -> đọc metadata cũ để merge rồi re-embed.
+    # Patch chỉ có dify_*/severity/tags (trường hợp phổ biến) không cần document cũ
+    # → bỏ find_one, update_one tự cho biết key có tồn tại (matched_count)
     if must_reembed:
+        # chỉ cần metadata để merge → không kéo embedding (vài nghìn float) + content về
+        existing = col.find_one({"key": req.key}, {"_id": 0, "metadata": 1, "content_hash": 1})
+        if not existing:
+            raise HTTPException(status_code=404, detail=f"Signal not found for key={req.key}")
+
+        meta = existing.get("metadata", {}) or {}
+        merged = {
+            "title": req.patch.title if req.patch.title is not None else meta.get("title", ""),
+            "description": req.patch.description if req.patch.description is not None else meta.get("description", ""),
+            "code_snippet": req.patch.code_snippet if req.patch.code_snippet is not None else meta.get("code_snippet", ""),
+            "file_name": req.patch.file_name if req.patch.file_name is not None else meta.get("file_name"),
+            "line_number": req.patch.line_number if req.patch.line_number is not None else meta.get("line_number"),
+        }
         new_content = _compose_content(merged)
-        emb = _embed_text(new_content)
-        update_set["content"] = new_content
-        update_set["embedding"] = emb
-        update_set["embedding_dimension"] = len(emb)
+        new_hash = content_hash(new_content)
+        # patch đổi field nhưng content ghép ra vẫn như cũ → embedding đang lưu vẫn đúng
+        if new_hash != existing.get("content_hash"):
+            emb = _embed_text(new_content)
+            update_set["content"] = new_content
+            update_set["embedding"] = emb
+            update_set["embedding_dimension"] = len(emb)
+            update_set["content_hash"] = new_hash
+
+    if not update_set:
+        # patch rỗng: $set {} bị Mongo từ chối → chỉ kiểm tra tồn tại
+        matched = col.count_documents({"key": req.key}, limit=1)
+        if not matched:
+            raise HTTPException(status_code=404, detail=f"Signal not found for key={req.key}")
+        return {"success": True, "matched": matched, "modified": 0}
 
     res = col.update_one({"key": req.key}, {"$set": update_set})
+    invalidate_search_cache(SCANNER_COLLECTION)
+    if not res.matched_count:
+        raise HTTPException(status_code=404, detail=f"Signal not found for key={req.key}")
     return {"success": True, "matched": res.matched_count, "modified": res.modified_count}
 
 @router.post("/upsert")
@@ -227,33 +308,11 @@ def upsert_scanner_signals(body: ScannerUpsertRequest):
 
     ops: List[UpdateOne] = []
 
-    for it in body.signals:
-        d = it.dict()
-        content = _compose_content(d)
-        if not content:
-            # bỏ qua record trống
-            continue
-        emb = _embed_text(content)
-        doc = {
-            "key": it.key,
-            "content": content,
-            "embedding": emb,
-            "embedding_dimension": len(emb),
-            "metadata": {
-                "id": it.id,
-                "title": it.title,
-                "description": it.description,
-                "code_snippet": it.code_snippet,
-                "file_name": it.file_name,
-                "line_number": it.line_number,
-                "severity": it.severity,
-                "tags": it.tags or [],
-                "source": it.source or "bearer",
-            },
-        }
+    # record trống bị _signal_docs bỏ qua
+    for doc in _signal_docs(col, body.signals):
         ops.append(
             UpdateOne(
-                {"key": it.key},
+                {"key": doc["key"]},
                 {"$set": doc, "$setOnInsert": {}},
                 upsert=True,
             )
@@ -263,6 +322,7 @@ def upsert_scanner_signals(body: ScannerUpsertRequest):
         return {"success": True, "upserted": 0, "modified": 0}
 
     res = col.bulk_write(ops, ordered=False)
+    invalidate_search_cache(SCANNER_COLLECTION)
     return {
         "success": True,
         "upserted": int(res.upserted_count or 0),
@@ -270,16 +330,23 @@ def upsert_scanner_signals(body: ScannerUpsertRequest):
     }
 
 @router.post("/search", response_model=ScannerSearchResponse)
-async def search_scanner(req: ScannerSearchRequest):
+def search_scanner(req: ScannerSearchRequest):
     try:
+        q_emb = get_query_embedding(req.query, _embed_text)
+        cached = get_cached_search(SCANNER_COLLECTION, req.filters, req.limit, q_emb)
+        if cached is not None:
+            return {"query": req.query, "sources": cached}
         mm = get_mongo_manager()
-        q_emb = _embed_text(req.query)
         results = mm.search_by_embedding(
             query_embedding=q_emb,
             top_k=int(req.limit),
             collection_name=SCANNER_COLLECTION,
             filters=req.filters or {},
-        )
-        return {"query": req.query, "sources": results or []}
+        ) or []
+        put_cached_search(SCANNER_COLLECTION, req.filters, req.limit, q_emb, results)
+        return {"query": req.query, "sources": results}
+    except ValueError as e:
+        # filter không hợp lệ (key lạ / toán tử Mongo) → lỗi của request
+        raise HTTPException(status_code=400, detail=f"Invalid search filters: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error during scanner search: {str(e)}")
\ No newline at end of file
@@ -2,7 +2,7 @@
 from __future__ import annotations
 
 from dataclasses import asdict, is_dataclass
-from datetime import datetime
+import functools
 import json
 import os
 import sys
@@ -18,6 +18,7 @@ from .base import Fixer
 root_env_path = Path(__file__).resolve().parents[4] / '.env'
 load_dotenv(root_env_path)
 
+@functools.lru_cache(maxsize=8)
 def _find_repo_root(start: Path) -> Path:
     """
     Tìm repo root theo heuristic:
@@ -32,6 +33,19 @@ def _find_repo_root(start: Path) -> Path:
         cur = cur.parent
     return start.resolve()
 
+@functools.lru_cache(maxsize=1)
+def _batch_fix_dir() -> Tuple[bool, Path, str]:
+    # layout cài đặt không đổi trong 1 process → dò một lần (cache_clear() nếu cần dò lại)
+    repo_root = _find_repo_root(Path(__file__).parent)
+    candidates = [
+        repo_root / "src" / "app" / "services" / "batch_fix",
+        repo_root / "services" / "batch_fix",
+    ]
+    for c in candidates:
+        if (c / "cli.py").exists():
+            return True, c, ""
+    return False, repo_root, "Cannot locate batch_fix under FixChain/src/app/services or services"
+
 class LLMFixer(Fixer):
     """Fixer triển khai bằng cách gọi batch_fix.py qua CLIService."""
 
@@ -61,15 +75,7 @@ class LLMFixer(Fixer):
         Tìm thư mục chứa batch_fix. Heuristic:
         - <repo_root>/FixChain/src/app/services/batch_fix
         """
-        repo_root = _find_repo_root(Path(__file__).parent)
-        candidates = [
-            repo_root / "src" / "app" / "services" / "batch_fix",
-            repo_root / "services" / "batch_fix",
-        ]
-        for c in candidates:
-            if (c / "cli.py").exists():
-                return True, c, ""
-        return False, repo_root, "Cannot locate batch_fix under FixChain/src/app/services or services"
+        return _batch_fix_dir()
 
     def _parse_summary_from_stdout(self, output_lines: str):
         s = output_lines.rstrip()
@@ -78,6 +84,17 @@ class LLMFixer(Fixer):
         if end == -1:
             return None
 
+        # Fast path: summary là dòng JSON ngay sau marker END_BATCH_RESULT → cắt thẳng,
+        # không cần duyệt ngược từng ký tự trên toàn bộ stdout
+        marker = s.rfind("END_BATCH_RESULT")
+        if marker != -1:
+            start = s.find('{', marker)
+            if start != -1 and start < end:
+                try:
+                    return json.loads(s[start:end+1])
+                except ValueError:
+                    pass
+
         in_string = False
         escape = False
         depth = 0
@@ -153,26 +170,20 @@ class LLMFixer(Fixer):
                 logger.error(msg)
                 return {"success": False, "fixed_count": 0, "error": msg}
 
-            # Tạo file issues theo timestamp trong source_dir để batch_fix dễ access
-            timestamp = datetime.now().strftime("%m%d_%H%M%S")
-            issues_file_path = Path(source_dir) / f"list_real_bugs_{timestamp}.json"
+            # Truyền issues qua stdin ("--issues-file -") thay vì ghi file tạm vào source_dir
             payload = [asdict(b) if is_dataclass(b) else b for b in list_real_bugs]
-            with open(issues_file_path, "w", encoding="utf-8") as f:
-                json.dump(payload, f, indent=2, ensure_ascii=True)
-
-            logger.debug("Created issues file: %s", issues_file_path)
+            issues_bytes = json.dumps(payload, ensure_ascii=True).encode("utf-8")
 
             # Chuẩn bị lệnh chạy batch_fix
             fix_cmd = [
                 sys.executable,
                 "-m", "src.app.services.batch_fix.cli",
                 str(source_dir),
-                "--issues-file",
-                str(issues_file_path)
+                "--issues-file", "-",
             ]
 
-            logger.debug("Running command: %s", " ".join(fix_cmd))
-            success, output_lines = CLIService.run_command_stream(fix_cmd)
+            logger.debug("Running command: %s (%d bytes of issues on stdin)", " ".join(fix_cmd), len(issues_bytes))
+            success, output_lines = CLIService.run_command_stream(fix_cmd, input_data=issues_bytes)
             output_text = "".join(output_lines)
 
             if not success:
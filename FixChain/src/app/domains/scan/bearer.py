@@ -1,14 +1,19 @@
 from __future__ import annotations
 import json
+import logging
 import os
+import re
 from pathlib import Path
 from typing import Dict, List
 
+import orjson
 from dotenv import load_dotenv
 from src.app.services.log_service import logger
 from src.app.services.cli_service import CLIService
 from .base import Scanner
 
+_ANSI_RE = re.compile(r'\x1b\[[0-9;]*m')
+
 root_env_path = Path(__file__).resolve().parents[4] / '.env'
 load_dotenv(root_env_path)
 
@@ -67,18 +72,14 @@ class BearerScanner(Scanner):
                 "--hide-progress-bar",
                 "--skip-path", "node_modules,*.git,__pycache__,.venv,venv,dist,build"
             ]
-            logger.debug(f"Running Bearer Docker scan: {scan_cmd}")
+            logger.debug("Running Bearer Docker scan: %s", scan_cmd)
             success, output_lines = CLIService.run_command_stream(scan_cmd)
 
             # Bearer đôi khi trả exit code != 0 nhưng vẫn có file output
             if not success and not output_file.exists():
                 logger.error("Bearer Docker scan failed")
                 bearer_output = ''.join(output_lines)
-                try:
-                    import re
-                    clean = re.sub(r'\x1b\[[0-9;]*m', '', bearer_output)
-                except Exception:
-                    clean = bearer_output
+                clean = _ANSI_RE.sub('', bearer_output)
                 logger.debug("Bearer scan output: %s", clean[:100])
                 return []
 
@@ -87,9 +88,10 @@ class BearerScanner(Scanner):
                 return []
 
             logger.debug("Reading Bearer results from: %s", output_file)
-            with output_file.open("r", encoding="utf-8") as f:
-                bearer_data = json.load(f)
-                logger.debug(f"Raw bearer response: {bearer_data}")
+            # orjson parse thẳng từ bytes (C parser, không qua bước decode text)
+            with output_file.open("rb") as f:
+                bearer_data = orjson.loads(f.read())
+                logger.debug("Raw bearer response: %s", bearer_data)
 
             bugs = self._convert_bearer_to_bugs_format(bearer_data)
             logger.info("Found %d Bearer security issues", len(bugs))
@@ -97,7 +99,7 @@ class BearerScanner(Scanner):
                 logger.debug("Sample bug: %s", bugs[0])
             return bugs
 
-        except json.JSONDecodeError as e:
+        except json.JSONDecodeError as e:  # orjson.JSONDecodeError là lớp con
             logger.error("Failed to parse Bearer JSON file: %s", e)
             return []
         except Exception as e:
@@ -114,7 +116,8 @@ class BearerScanner(Scanner):
             for finding in bearer_data.get(severity, []):
                 finding["severity"] = severity
                 findings.append(finding)
-        logger.debug(f"Total findings collected: {str(findings)[:100]}")
+        if logger.isEnabledFor(logging.DEBUG):  # str(findings) dựng chuỗi của cả list → chỉ khi bật DEBUG
+            logger.debug("Total findings collected: %s", str(findings)[:100])
 
         for finding in findings:
             try:
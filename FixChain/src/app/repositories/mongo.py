@@ -1,11 +1,15 @@
 # src\app\repositories\mongo.py
 import os
 import math
+import threading
+import uuid
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import List, Dict, Any, Optional
+import numpy as np
 from pymongo import MongoClient, ASCENDING, TEXT
 from pymongo.collection import Collection
+from pymongo.errors import OperationFailure
 from dotenv import load_dotenv
 from src.app.services.log_service import logger
 
@@ -20,11 +24,46 @@ def _env(name: str, default: str) -> str:
     v = os.getenv(name)
     return v.strip() if v and v.strip() else default
 
+# Lỗi cho biết server không có stage $vectorSearch — lặp lại ở mọi lần gọi nên được nhớ:
+# 40324 "Unrecognized pipeline stage name" (MongoDB cũ), 6047401 "only allowed on MongoDB Atlas" (CE 7+).
+# Lỗi khác (sai tên index, field filter chưa khai báo...) không được coi là "không hỗ trợ".
+_VECTOR_STAGE_UNSUPPORTED_CODES = frozenset({40324, 6047401})
+
+def _vector_stage_unsupported(e: OperationFailure) -> bool:
+    return e.code in _VECTOR_STAGE_UNSUPPORTED_CODES or "Unrecognized pipeline stage" in str(e)
+
+# Filter /search đến từ request; metadata fixer là dict tuỳ caller nên key không cố định.
+# Chặn toán tử Mongo: key không được bắt đầu bằng "$" / chứa ".", giá trị chỉ là scalar hoặc list scalar.
+# field lưu dạng mảng đã biết: filter phải là list (so khớp nguyên mảng như trước, không phải "mảng chứa giá trị")
+_ARRAY_FILTER_KEYS = frozenset({"tags", "labels"})
+_FILTER_SCALARS = (str, int, float, bool, type(None))
+
+
+def _filter_clause(key: str, value: Any) -> Dict[str, Any]:
+    if not key or key.startswith("$") or "." in key:
+        raise ValueError(f"Unsupported search filter: {key!r}")
+    if isinstance(value, list):
+        if not all(isinstance(v, _FILTER_SCALARS) for v in value):
+            raise ValueError(f"Filter {key!r} must be a list of scalars")
+    elif key in _ARRAY_FILTER_KEYS or not isinstance(value, _FILTER_SCALARS):
+        raise ValueError(f"Filter {key!r} must be a scalar or a list of scalars")
+    # $eq tường minh: list so khớp nguyên giá trị, giống so sánh == của bản lọc Python cũ
+    return {"$eq": value}
+
+
+def _metadata_filter(filters: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    filters của request → điều kiện Mongo trên metadata.* ({"severity": "HIGH"} → {"$eq": "HIGH"}).
+    Key "$..."/có dấu chấm hoặc giá trị không phải scalar / list scalar → ValueError.
+    """
+    return {f"metadata.{k}": _filter_clause(k, v) for k, v in (filters or {}).items()}
+
+
 class MongoDBManager:
     """
     Chuẩn hoá:
     - Document chính lưu luôn field `embedding` (float[]), `embedding_dimension`.
-    - search_by_embedding: ưu tiên $vectorSearch (index: vector_index, path: embedding), fallback cosine.
+    - search_by_embedding: ưu tiên $vectorSearch khi có MONGODB_VECTOR_INDEX (path: embedding), fallback cosine.
     - Giữ tương thích ngược: vẫn có `embeddings_collection` nếu dữ liệu cũ còn đó.
     """
     def __init__(self):
@@ -41,6 +80,12 @@ class MongoDBManager:
         self.scanner_col = self.db[self.scanner_col_name]
         self.fixer_col = self.db[self.fixer_col_name]
 
+        # Atlas Vector Search index (type vectorSearch, path: embedding, similarity cosine).
+        # Chỉ thử $vectorSearch khi cấu hình rõ: stack mặc định (mongo:7 CE) không có stage này
+        self.vector_index = _env("MONGODB_VECTOR_INDEX", "") or None
+        # collection mà server không hỗ trợ $vectorSearch → đi thẳng cosine, không thử lại mỗi lần
+        self._no_vector_search: set = set()
+
         try:
             # Ping
             ping = self.client.admin.command("ping")
@@ -66,6 +111,8 @@ class MongoDBManager:
         # lọc nhanh theo các trường phổ biến
         try:
             col.create_index([("doc_id", ASCENDING)], unique=True)
+            # scanner /update, /upsert lọc theo key cho từng signal → tránh collscan mỗi op
+            col.create_index([("key", ASCENDING)])
             col.create_index([("created_at", ASCENDING)])
             col.create_index([("metadata.project_key", ASCENDING)])
             col.create_index([("metadata.repo", ASCENDING)])
@@ -99,7 +146,8 @@ class MongoDBManager:
         try:
             col = self.collection(collection_name)
             metadata = metadata or {}
-            doc_id = f"doc_{datetime.now().timestamp()}"
+            # uuid thay cho timestamp: 2 insert trong cùng tick đồng hồ không còn trùng doc_id
+            doc_id = f"doc_{uuid.uuid4().hex}"
 
             document: Dict[str, Any] = {
                 "doc_id": doc_id,
@@ -152,46 +200,110 @@ class MongoDBManager:
         filters: Optional[Dict[str, Any]] = None,
     ) -> List[Dict[str, Any]]:
         """
-        Cosine similarity trên embedding lưu trong document (fallback cho MongoDB CE/7.0).
+        Top-k document gần query_embedding nhất.
+        - Ưu tiên $vectorSearch (ANN/HNSW, không quét cả collection) nếu đặt MONGODB_VECTOR_INDEX.
+        - Fallback cosine brute-force (MongoDB CE/7.0, hoặc chưa có index).
+        filters: so khớp chính xác theo metadata (xem _metadata_filter); key không hỗ trợ → ValueError.
+        similarity_score luôn là cosine [-1, 1], path nào chạy cũng cùng thang.
         """
         col = self.collection(collection_name)
+        # validate trước khi chạm DB: filter xấu → ValueError cho caller, không bị bọc lại
+        match = _metadata_filter(filters)
+        if self.vector_index and col.name not in self._no_vector_search:
+            try:
+                hits = self._vector_search(col, query_embedding, top_k, match)
+                # index chưa tạo thì Atlas trả rỗng thay vì lỗi → vẫn thử cosine
+                if hits:
+                    return hits
+            except OperationFailure as e:
+                # server không có stage → nhớ luôn; lỗi khác (index/filter sai trên Atlas thật)
+                # chỉ log, lần sau vẫn thử $vectorSearch
+                if _vector_stage_unsupported(e):
+                    self._no_vector_search.add(col.name)
+                    logger.info("[%s] $vectorSearch unavailable, using cosine fallback: %s", col.name, e)
+                else:
+                    logger.warning("[%s] $vectorSearch failed, using cosine fallback: %s", col.name, e)
+        return self._search_by_cosine(col, query_embedding, top_k, match)
+
+    def _vector_search(
+        self,
+        col: Collection,
+        query_embedding: List[float],
+        top_k: int,
+        match: Dict[str, Any],
+    ) -> List[Dict[str, Any]]:
+        stage: Dict[str, Any] = {
+            "index": self.vector_index,
+            "path": "embedding",
+            "queryVector": query_embedding,
+            "numCandidates": max(top_k * 10, 100),
+            "limit": top_k,
+        }
+        if match:
+            # field filter phải được khai báo type "filter" trong index
+            stage["filter"] = match
+        pipeline = [
+            {"$vectorSearch": stage},
+            {"$project": {
+                "_id": 0, "doc_id": 1, "content": 1, "metadata": 1,
+                # vectorSearchScore (similarity cosine) = (1 + cos) / 2 → đổi về cosine như path fallback
+                "similarity_score": {"$subtract": [{"$multiply": [2, {"$meta": "vectorSearchScore"}]}, 1]},
+            }},
+        ]
+        hits = list(col.aggregate(pipeline))
+        for h in hits:
+            h.setdefault("content", "")
+            h["metadata"] = h.get("metadata") or {}
+        return hits
+
+    def _search_by_cosine(
+        self,
+        col: Collection,
+        query_embedding: List[float],
+        top_k: int,
+        match: Dict[str, Any],
+    ) -> List[Dict[str, Any]]:
+        """
+        Cosine similarity trên embedding lưu trong document (quét mọi document khớp filter).
+        Tính vector hoá: gom embedding thành ma trận float32 (N, d) → 1 phép matmul thay vì vòng lặp Python.
+        """
         try:
-            cursor = col.find({"embedding": {"$exists": True}}, {
-                "doc_id": 1, "embedding": 1, "content": 1, "metadata": 1
-            })
-
-            sims: List[Dict[str, Any]] = []
-            for d in cursor:
-                vec = d.get("embedding") or []
-                score = self.cosine_similarity(query_embedding, vec)
-
-                md = d.get("metadata") or {}
-                if filters:
-                    # Áp dụng filter chính xác theo metadata
-                    for fk, fv in filters.items():
-                        if md.get(fk) != fv:
-                            break
-                    else:
-                        sims.append({
-                            "doc_id": d.get("doc_id"),
-                            "content": d.get("content", ""),
-                            "metadata": md,
-                            "similarity_score": score,
-                        })
-                    continue
-
-                sims.append({
-                    "doc_id": d.get("doc_id"),
-                    "content": d.get("content", ""),
-                    "metadata": md,
-                    "similarity_score": score,
-                })
-
-            sims.sort(key=lambda x: x["similarity_score"], reverse=True)
-            return sims[:top_k]
+            docs = list(col.find({"embedding": {"$exists": True}, **match}, {
+                "_id": 0, "doc_id": 1, "embedding": 1, "content": 1, "metadata": 1
+            }))
+            if not docs:
+                return []
+
+            q = np.asarray(query_embedding, dtype=np.float32)
+            dim = q.shape[0]
+            scores = np.zeros(len(docs), dtype=np.float32)
+            # embedding rỗng (import lỗi) / lệch số chiều → score 0
+            rows = [i for i, d in enumerate(docs) if len(d.get("embedding") or ()) == dim]
+            q_norm = float(np.linalg.norm(q))
+            if rows and q_norm > 0:
+                mat = np.asarray([docs[i]["embedding"] for i in rows], dtype=np.float32)
+                norms = np.linalg.norm(mat, axis=1) * q_norm
+                dots = mat @ q
+                scores[rows] = np.divide(dots, norms, out=np.zeros_like(dots), where=norms > 0)
+
+            # top-k bằng argpartition O(N), chỉ sort k phần tử được chọn thay vì sort cả N
+            k = min(top_k, scores.size)
+            if k <= 0:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k]
+            order = top[np.argsort(-scores[top], kind="stable")]
+            return [
+                {
+                    "doc_id": docs[i].get("doc_id"),
+                    "content": docs[i].get("content", ""),
+                    "metadata": docs[i].get("metadata") or {},
+                    "similarity_score": float(scores[i]),
+                }
+                for i in order
+            ]
 
         except Exception as e:
-            raise Exception(f"Error searching by embedding in {collection_name}: {str(e)}")
+            raise Exception(f"Error searching by embedding in {col.name}: {str(e)}")
         
     @staticmethod
     def cosine_similarity(vec1: List[float], vec2: List[float]) -> float:
@@ -209,12 +321,16 @@ class MongoDBManager:
 
 # Singleton
 _mongo_manager: Optional[MongoDBManager] = None
+_mongo_manager_lock = threading.Lock()
 
 
 def get_mongo_manager() -> MongoDBManager:
     global _mongo_manager
     if _mongo_manager is None:
-        _mongo_manager = MongoDBManager()
+        # route sync chạy trong threadpool → khoá để chỉ một thread tạo client/index
+        with _mongo_manager_lock:
+            if _mongo_manager is None:
+                _mongo_manager = MongoDBManager()
     return _mongo_manager
 
 
@@ -228,9 +344,11 @@ class MongoDBService:
     # Logging chung (không thuộc RAG)
     def insert_execution_log(self, log_entry: Dict[str, Any]) -> str:
         col = self.manager.db["execution_logs"]
+        # 1 lần đọc đồng hồ cho cả 2 field → timestamp và created_at khớp nhau
+        now = now_utc()
         if "timestamp" not in log_entry:
-            log_entry["timestamp"] = now_utc().isoformat()
-        log_entry["created_at"] = now_utc()
+            log_entry["timestamp"] = now.isoformat()
+        log_entry["created_at"] = now
         res = col.insert_one(log_entry)
         return str(res.inserted_id)
 
@@ -248,9 +366,10 @@ class MongoDBService:
     # Dataset registry (không phải RAG store)
     def insert_rag_dataset(self, dataset_info: Dict[str, Any]) -> str:
         col = self.manager.db["rag_datasets"]
+        now = now_utc()
         if "inserted_at" not in dataset_info:
-            dataset_info["inserted_at"] = now_utc().isoformat()
-        dataset_info["created_at"] = now_utc()
+            dataset_info["inserted_at"] = now.isoformat()
+        dataset_info["created_at"] = now
         res = col.insert_one(dataset_info)
         return str(res.inserted_id)
 
@@ -268,7 +387,8 @@ class MongoDBService:
     # Kết quả fix (tuỳ ứng dụng, có thể giữ nguyên)
     def insert_bug_fix_result(self, fix_result: Dict[str, Any]) -> str:
         col = self.manager.db["bug_fixes"]
-        fix_result["created_at"] = now_utc()
-        fix_result["timestamp"] = now_utc().isoformat()
+        now = now_utc()
+        fix_result["created_at"] = now
+        fix_result["timestamp"] = now.isoformat()
         res = col.insert_one(fix_result)
         return str(res.inserted_id)
\ No newline at end of file
@@ -1,5 +1,7 @@
 # src/app/repositories/mongo_utils.py
 import os
+import threading
+import time
 from pathlib import Path
 from typing import Dict, Any, List, Optional
 from dotenv import load_dotenv
@@ -13,13 +15,23 @@ MONGO_URI = os.getenv("MONGODB_URI", "")
 MONGO_DB_NAME = os.getenv("MONGODB_DATABASE", "fixchain")
 
 _client: Optional[MongoClient] = None
+_client_lock = threading.Lock()
+
+# /health gọi ensure_collection mỗi hit (list_collection_names + create_index mỗi index).
+# Kết quả được giữ _ENSURE_TTL_S giây → health dồn dập chỉ chạm Mongo tối đa 1 lần / TTL / collection.
+_ENSURE_TTL_S = float(os.getenv("MONGO_ENSURE_TTL_S", "30"))
+_ensured: Dict[str, Any] = {}
 
 def get_client() -> MongoClient:
     global _client
     if _client is None:
-        _client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=3000)
-    # ping để xác thực kết nối
-    _client.admin.command("ping")
+        with _client_lock:
+            if _client is None:
+                client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=3000)
+                # ping một lần khi tạo client để xác thực kết nối;
+                # các lần gọi sau tái sử dụng client (pool tự xử lý reconnect)
+                client.admin.command("ping")
+                _client = client
     return _client
 
 def ensure_collection(
@@ -31,6 +43,12 @@ def ensure_collection(
     indexes: danh sách định nghĩa index ở dạng:
       [{"keys": [("source_id", 1)], "unique": False, "name": "idx_source_id"}]
     """
+    cache_key = f"{collection_name}|{indexes!r}"
+    hit = _ensured.get(cache_key)
+    if hit is not None and time.monotonic() - hit[0] < _ENSURE_TTL_S:
+        # bản sao: caller sửa kết quả không làm hỏng cache; lần này không tạo gì mới
+        return {**hit[1], "existed": True, "created": False, "indexes_applied": list(hit[1]["indexes_applied"])}
+
     client = get_client()
     db = client[MONGO_DB_NAME]
 
@@ -62,7 +80,7 @@ def ensure_collection(
             # Không làm "vỡ" health nếu index gặp trục trặc
             pass
 
-    return {
+    result = {
         "ok": True,
         "db": MONGO_DB_NAME,
         "collection": collection_name,
@@ -70,3 +88,5 @@ def ensure_collection(
         "created": created,
         "indexes_applied": applied_indexes,
     }
+    _ensured[cache_key] = (time.monotonic(), result)
+    return {**result, "indexes_applied": list(applied_indexes)}
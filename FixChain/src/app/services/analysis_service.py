@@ -2,9 +2,10 @@
 from __future__ import annotations
 from collections import Counter
 from dataclasses import asdict, dataclass, field
-import json
 import os
+import re
 from typing import Dict, List, Any, TypedDict, Optional, Union, cast
+import orjson
 
 from src.app.domains.fix.models import RealBug
 from src.app.services.log_service import logger
@@ -18,6 +19,25 @@ class AnalysisResult(TypedDict, total=False):
     list_bugs: List[RealBug]
     bugs_to_fix: int
 
+# action/classification của Dify → label. Dify trả đúng "Fix" / "Ignore" (có thể kèm giải thích phía sau):
+# keyword phải đứng đầu action (đã strip) và là nguyên từ → "Do not fix", "Prefix...", "Unfixable" = UNKNOWN.
+# Các keyword không cái nào là tiền tố nguyên từ của cái khác nên thứ tự trong alternation không quan trọng.
+_ACTION_LABELS = (
+    ("TRUE POSITIVE", "BUG"),
+    ("FALSE POSITIVE", "CODE SMELL"),
+    ("FIX", "BUG"),
+    ("IGNORE", "CODE SMELL"),
+)
+_ACTION_LABEL_MAP = dict(_ACTION_LABELS)
+_ACTION_RE = re.compile(r"(?:%s)\b" % "|".join(re.escape(k) for k, _ in _ACTION_LABELS))
+# classification của Dify (đã strip + lower) → dạng chuẩn; giá trị lạ giữ nguyên
+_CLASSIFICATION_MAP = {
+    "tp": "True Positive",
+    "true positive": "True Positive",
+    "fp": "False Positive",
+    "false positive": "False Positive",
+}
+
 class AnalysisService:
     """Service for analyzing bugs and interacting with Dify."""
 
@@ -80,7 +100,7 @@ class AnalysisService:
             # ---------------------------------------------------------
             inputs = {
                 "src": source_code or "",
-                "report": json.dumps(bearer_report, ensure_ascii=False),
+                "report": orjson.dumps(bearer_report, default=str).decode(),
                 "retrieved_context": retrieved_context,
             }
 
@@ -124,11 +144,19 @@ class AnalysisService:
         Build query string from Bearer report.
         """
         terms: List[str] = []
+        seen: set[str] = set()
+        size = 0
         for it in report or []:
+            # query bị cắt ở 1000 ký tự → đủ rồi thì dừng, không duyệt tiếp report
+            if size >= 1000:
+                break
             logger.debug("Processing Bearer report item for query: %s...", str(it)[:100])
             for k in ("key", "file_name", "tags", "code_snippet"):
                 v = str(it.get(k, "")).strip()
-                if v and v not in terms:
+                if v and v not in seen:
+                    seen.add(v)
+                    # size = độ dài chuỗi join thật: " | " chỉ đứng giữa các term
+                    size += len(v) + (3 if terms else 0)
                     terms.append(v)
         # keep it short for embedding
         q = " | ".join(terms)[:1000]
@@ -157,11 +185,8 @@ class AnalysisService:
     
     @staticmethod
     def _get_label(action: str) -> str:
-        if "FIX" or "TRUE POSITIVE" or "Fix" in action:
-            return "BUG"
-        elif "IGNORE" or "FALSE POSITIVE" or "Ignore" in action:
-            return "CODE SMELL"
-        return "UNKNOWN"
+        m = _ACTION_RE.match(action.strip().upper())
+        return _ACTION_LABEL_MAP[m.group()] if m else "UNKNOWN"
 
     def _normalize_labeled_signals(self, list_bugs: Union[List[Any], Dict[str, Any], str]):
         """
@@ -296,12 +321,7 @@ class AnalysisService:
     def _norm_classification(self, s: Optional[str]) -> Optional[str]:
         if not s:
             return None
-        sl = s.strip().lower()
-        if sl in {"tp", "true positive"}:
-            return "True Positive"
-        if sl in {"fp", "false positive"}:
-            return "False Positive"
-        return s
+        return _CLASSIFICATION_MAP.get(s.strip().lower(), s)
 
     def _rb_to_scanner_signal(self, rb: "RealBug") -> "ScannerRAGSignal":
         # Build a minimal yet valid ScannerRAGSignal for upsert/insert
@@ -333,6 +353,11 @@ class AnalysisService:
         if not labeled_signals:
             return
 
+        # API có sẵn của self.rag không đổi trong vòng lặp → tra 1 lần thay vì hasattr mỗi item
+        update_signal = getattr(self.rag, "update_scanner_signal", None)
+        upsert_signals = getattr(self.rag, "upsert_scanner_signals", None)
+        add_signals = getattr(self.rag, "add_scanner_signals", None)
+
         for rb in labeled_signals:
             try:
                 key = getattr(rb, "key", None)
@@ -350,9 +375,9 @@ class AnalysisService:
                 updated = False
 
                 # Prefer update by key
-                if key and hasattr(self.rag, "update_scanner_signal"):
+                if key and update_signal is not None:
                     try:
-                        updated = bool(self.rag.update_scanner_signal(key, update_fields))
+                        updated = bool(update_signal(key, update_fields))
                     except Exception as e:
                         logger.debug("Scanner RAG update by key failed (key=%s): %s", key, e)
                         updated = False
@@ -362,28 +387,28 @@ class AnalysisService:
                     merged_sig = self._rb_to_scanner_signal(rb)
 
                     # Prefer typed upsert API
-                    if hasattr(self.rag, "upsert_scanner_signals"):
+                    if upsert_signals is not None:
                         try:
-                            self.rag.upsert_scanner_signals([merged_sig])
+                            upsert_signals([merged_sig])
                             updated = True
                         except Exception as e:
                             logger.debug("rag.upsert_scanner_signals failed: %s", e)
                             updated = False
 
                     # Fallback to add API (dict payload)
-                    if not updated and hasattr(self.rag, "add_scanner_signals"):
+                    if not updated and add_signals is not None:
                         try:
-                            self.rag.add_scanner_signals([asdict(merged_sig)])
+                            add_signals([asdict(merged_sig)])
                             updated = True
                         except Exception as e:
                             logger.debug("rag.add_scanner_signals failed: %s", e)
                             updated = False
 
                     # Last resort: try an update method that can upsert if supported
-                    if not updated and hasattr(self.rag, "update_scanner_signal"):
+                    if not updated and update_signal is not None:
                         try:
                             # use the merged doc as update body
-                            self.rag.update_scanner_signal(merged_sig.key, asdict(merged_sig))
+                            update_signal(merged_sig.key, asdict(merged_sig))
                             updated = True
                         except Exception:
                             updated = False
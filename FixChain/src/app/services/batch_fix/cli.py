@@ -1,9 +1,10 @@
 # src/app/services/batch_fix/cli.py
 from __future__ import annotations
 from collections import defaultdict
-import argparse, json, os
+import argparse, json, os, sys
 from pathlib import Path
 from typing import Any, List, Mapping, Sequence
+import orjson
 from dotenv import load_dotenv
 from src.app.domains.fix.llm import RealBug
 from src.app.services.log_service import logger
@@ -12,8 +13,10 @@ from src.app.services.batch_fix.processor import SecureFixProcessor
 def load_issues_group_by_file(path):
     issues_by_file = defaultdict(list)
 
-    data = json.loads(Path(path).read_text(encoding="utf-8"))
-    logger.debug(f"Fixer received data: {data}")
+    # "-" → đọc từ stdin (LLMFixer truyền issues qua pipe)
+    raw = sys.stdin.buffer.read() if path == "-" else Path(path).read_bytes()
+    data = orjson.loads(raw)  # parse thẳng từ bytes, không decode sang str trước
+    logger.debug("Fixer received data: %s", data)
     for d in data:
         fn = d.get("file_name")
         key = os.path.normpath(fn) if fn else "UNKNOWN"
@@ -46,13 +49,13 @@ def run():
 
     directory = args.destination
     if not directory or not os.path.isdir(directory):
-        logger.error(f"Invalid directory: {directory}"); return
+        logger.error("Invalid directory: %s", directory); return
 
     issues_by_file = {}
-    if args.issues_file and os.path.exists(args.issues_file):
+    if args.issues_file and (args.issues_file == "-" or os.path.exists(args.issues_file)):
         try:
             issues_by_file = load_issues_group_by_file(args.issues_file)
-            logger.debug(f"Loaded issues from {args.issues_file}, total files with issues: {issues_by_file}")
+            logger.debug("Loaded issues from %s, total files with issues: %s", args.issues_file, issues_by_file)
         except Exception as e:
             logger.warning("Cannot load issues file: %s", e)
 
@@ -62,43 +65,50 @@ def run():
     # collect files
     code_ext = (".py",".js",".ts",".jsx",".tsx",".java",".cpp",".c",".html",".css",".txt")
     code_files = []
+    # bind sẵn các hàm dùng trong vòng lặp walk (gọi cho mọi file/thư mục)
+    ignore = processor.should_ignore_file
+    join = os.path.join
+    add = code_files.append
     for root, dirs, files in os.walk(directory):
-        dirs[:] = [d for d in dirs if not processor.should_ignore_file(os.path.join(root,d), directory)]
+        dirs[:] = [d for d in dirs if not ignore(join(root,d), directory)]
         for f in files:
-            p = os.path.join(root, f)
-            if processor.should_ignore_file(p, directory): continue
-            if f.lower().endswith(code_ext): code_files.append(p)
+            p = join(root, f)
+            if ignore(p, directory): continue
+            if f.lower().endswith(code_ext): add(p)
 
     if not code_files:
-        logger.error(f"No code files found in: {directory}"); return
+        logger.error("No code files found in: %s", directory); return
 
-    logger.debug(f"Directory: {directory}")
-    logger.info(f"Found {len(code_files)} code files")
+    logger.debug("Directory: %s", directory)
+    logger.info("Found %d code files", len(code_files))
     logger.info("Files to process:")
     for i, p in enumerate(code_files, 1):
-        logger.info(f"  {i:2d}. {os.path.relpath(p, directory)}")
+        logger.info("  %2d. %s", i, os.path.relpath(p, directory))
 
     results = []
-    for i, p in enumerate(code_files, 1):
-        rel = os.path.relpath(p, directory)
-        logger.info(f"[{i}/{len(code_files)}] {'Fixing'}: {rel}")
-        file_issues_raw = issues_by_file.get(rel, [])
-        file_issues: List[RealBug] = ensure_realbug_list(file_issues_raw)
-        if file_issues:
-            logger.debug("File issue to be fixed: %s", file_issues)
-            r = processor.fix_buggy_file(
-                file_path=p, template_type="fix",
-                issues_data=file_issues
-            )
-            logger.debug("Fixed file %s with result: %s", rel, r)
-            results.append(r)
-            if r.success:
-                logger.info(f"Success: {r.processing_time:.1f}s")
-            else:
-                logger.info(f"Failed: {r.message}")
-        else:    
-            logger.info("No bug found in this file")
-            pass
+    try:
+        for i, p in enumerate(code_files, 1):
+            rel = os.path.relpath(p, directory)
+            logger.info("[%d/%d] Fixing: %s", i, len(code_files), rel)
+            file_issues_raw = issues_by_file.get(rel, [])
+            file_issues: List[RealBug] = ensure_realbug_list(file_issues_raw)
+            if file_issues:
+                logger.debug("File issue to be fixed: %s", file_issues)
+                r = processor.fix_buggy_file(
+                    file_path=p, template_type="fix",
+                    issues_data=file_issues
+                )
+                logger.debug("Fixed file %s with result: %s", rel, r)
+                results.append(r)
+                if r.success:
+                    logger.info("Success: %.1fs", r.processing_time)
+                else:
+                    logger.info("Failed: %s", r.message)
+            else:    
+                logger.info("No bug found in this file")
+                pass
+    finally:
+        processor.close()
 
     # summary
     success = sum(1 for r in results if r.success)
@@ -111,12 +121,12 @@ def run():
     avg_time = sum(r.processing_time for r in results)/max(len(results),1)
 
     logger.info("="*50)
-    logger.info(f"FIX RESULT: {str(success).upper()}")
-    logger.info(f"TOTAL INPUT TOKENS: {total_in}")
-    logger.info(f"TOTAL OUTPUT TOKENS: {total_out}")
-    logger.info(f"TOTAL TOKENS: {total_tok}")
-    logger.info(f"AVERAGE SIMILARITY: {avg_sim:.3f}")
-    logger.info(f"AVERAGE PROCESSING TIME: {avg_time:.1f}")
+    logger.info("FIX RESULT: %s", str(success).upper())
+    logger.info("TOTAL INPUT TOKENS: %d", total_in)
+    logger.info("TOTAL OUTPUT TOKENS: %d", total_out)
+    logger.info("TOTAL TOKENS: %d", total_tok)
+    logger.info("AVERAGE SIMILARITY: %.3f", avg_sim)
+    logger.info("AVERAGE PROCESSING TIME: %.1f", avg_time)
 
     summary = {
         "success": True,
@@ -1,15 +1,16 @@
 # src/app/services/batch_fix/processor.py
 from __future__ import annotations
-from dataclasses import asdict, is_dataclass
-import os, json, fnmatch
+import asyncio, os, fnmatch, functools, shutil, tempfile
 import re
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 from pathlib import Path
 from datetime import datetime
+import orjson
 from src.app.domains.fix.llm import RealBug
 from src.app.services.log_service import logger
 from src.app.services.batch_fix.models import FixResult
 from src.app.services.batch_fix import validators as V
+from src.app.services.batch_fix import serena_runner
 from src.app.services.batch_fix.templates import TemplateManager, strip_markdown_code
 from src.app.services.batch_fix.rag_integration import RAGAdapter
 from src.app.adapters.llm.google_genai import client, GENERATION_MODEL
@@ -22,15 +23,139 @@ _RE_FLAG_MAP = {
     "S": re.DOTALL,     "DOTALL": re.DOTALL,
     "X": re.VERBOSE,    "VERBOSE": re.VERBOSE,
 }
+# file lớn hơn ngưỡng này được ghi local thay vì gửi nguyên nội dung qua MCP
+_INLINE_WRITE_MAX = 64 * 1024
+_FLAG_SPLIT_RE = re.compile(r"[|,\s]+")
+# smart quotes → ASCII quotes, áp dụng trong một lượt
+_SMART_QUOTES = str.maketrans({"\u201c": '"', "\u201d": '"', "\u2018": "'", "\u2019": "'"})
+# regex dùng khi làm sạch block instruction — compile một lần ở mức module
+_FENCE_OPEN_RE = re.compile(r"^```(?:json|yaml)?\s*", re.IGNORECASE)
+_FENCE_CLOSE_RE = re.compile(r"\s*```$")
+_MARKER_BLOCK_RE = re.compile(rf"{re.escape(MARKER_START)}\s*(.*?)\s*{re.escape(MARKER_END)}", re.DOTALL)
+_TRAILING_COMMA_RE = re.compile(r",(\s*[}\]])")
+
+
+def _atomic_write_text(file_path: str, text: str) -> None:
+    """Ghi file qua tmp + os.replace để không để lại file ghi dở nếu process chết giữa chừng."""
+    # tên tmp duy nhất (mkstemp) cùng thư mục → không đụng nhau khi nhiều tiến trình ghi cùng file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(file_path) or ".", prefix=os.path.basename(file_path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(text.encode("utf-8"))
+        try:
+            shutil.copymode(file_path, tmp)
+        except OSError:
+            pass
+        os.replace(tmp, file_path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+@functools.lru_cache(maxsize=512)
+def _compiled_regex(pattern: str, flags: int) -> re.Pattern:
+    # cache riêng, không bị đẩy ra khỏi cache nội bộ (nhỏ) của module re khi batch dùng nhiều pattern
+    return re.compile(pattern, flags)
+
+
+# replace_regex của Serena: DOTALL|MULTILINE mặc định, backreference dạng $!1 (\1 giữ nguyên chữ)
+_SERENA_REGEX_FLAGS = re.DOTALL | re.MULTILINE
+_SERENA_BACKREF_RE = re.compile(r"\$!(\d+)")
+
+
+def _serena_regex_sub(content: str, pattern: str, repl: str) -> Optional[str]:
+    """Bản in-process của replace_regex (Serena); None khi Serena sẽ từ chối (0 hoặc >1 match)."""
+    rx = _compiled_regex(pattern, _SERENA_REGEX_FLAGS)
+    matches = list(rx.finditer(content))
+    if len(matches) != 1:
+        return None
+    m = matches[0]
+    out = _SERENA_BACKREF_RE.sub(lambda b: m.group(int(b.group(1))) or "", repl)
+    return content[:m.start()] + out + content[m.end():]
+
+
+@functools.lru_cache(maxsize=256)
+def _load_instruction_payload(payload: str) -> dict:
+    """Parse block instruction (JSON, fallback YAML). Kết quả được cache và dùng chung → chỉ đọc, không sửa."""
+    try:
+        return orjson.loads(payload)
+    except orjson.JSONDecodeError:
+        try:
+            import yaml  # optional
+            return yaml.safe_load(payload)
+        except Exception:
+            raise ValueError("Serena instructions must be JSON or YAML")
+
+
+def _symbol_path(step: Dict[str, Any]) -> str:
+    return step.get("relative_path") or step.get("path") or ""
+
+
+# op → lời gọi SerenaClient tương ứng; regex_replace/exec có tiền xử lý riêng nên xử lý inline
+_STEP_CALLS = {
+    "replace_symbol_body": lambda sc, st: sc.apply_patch_by_symbol(
+        name_path=st["name_path"], relative_path=_symbol_path(st), new_body=st["new_body"],
+    ),
+    "replace_lines": lambda sc, st: sc.replace_lines(
+        path=st["path"], start_line=int(st["start_line"]), end_line=int(st["end_line"]),
+        new_text=st["new_text"],
+    ),
+    "insert_before_symbol": lambda sc, st: sc.insert_before_symbol(
+        name_path=st["name_path"], relative_path=_symbol_path(st), text=st["text"],
+    ),
+    "insert_after_symbol": lambda sc, st: sc.insert_after_symbol(
+        name_path=st["name_path"], relative_path=_symbol_path(st), text=st["text"],
+    ),
+}
+_KNOWN_OPS = frozenset({"regex_replace", "exec", *_STEP_CALLS})
+
+
+def _step_file(step: Dict[str, Any]) -> Optional[str]:
+    """File mà step sửa (chuẩn hoá); None → exec / không rõ phạm vi."""
+    if (step.get("op") or "").lower() == "exec":
+        return None
+    p = step.get("path") or step.get("relative_path")
+    return os.path.normpath(p) if p else None
+
+
+def _schedule_waves(files: List[Optional[str]]) -> List[List[int]]:
+    """Chia các việc (theo thứ tự) thành wave: trong 1 wave không có 2 việc cùng file.
+
+    Việc chạm file f chạy sau mọi việc trước nó trên f; việc None (exec) là barrier:
+    chạy sau tất cả việc trước nó, mọi việc sau nó chạy sau nó.
+    """
+    waves: List[List[int]] = []
+    last: Dict[str, int] = {}
+    floor = -1  # wave của barrier gần nhất
+    for i, f in enumerate(files):
+        if f is None:
+            w = len(waves)
+            floor = w
+        else:
+            w = max(last.get(f, -1), floor) + 1
+            last[f] = w
+        if w == len(waves):
+            waves.append([])
+        waves[w].append(i)
+    return waves
 
 class SecureFixProcessor:
     def __init__(self, source_dir: str) -> None:
         self.source_dir = os.path.abspath(source_dir)
         self.similarity_threshold = 0.85
         self.ignore_patterns: List[str] = []
+        self._ignore_dirs: tuple = ()
+        self._ignore_re: Optional[re.Pattern] = None
         self.tm = TemplateManager()
         self.rag = RAGAdapter()
 
+    def close(self) -> None:
+        """Giải phóng tài nguyên dùng chung cho cả batch (event loop Serena)."""
+        serena_runner.shutdown()
+
     def load_ignore_patterns(self, base_dir: str) -> None:
         defaults = [
             "*.pyc","__pycache__/","*.pyo","*.pyd",".git/",".svn/",".hg/",".bzr/",
@@ -43,18 +168,32 @@ class SecureFixProcessor:
         if os.path.exists(fx):
             try:
                 with open(fx, "r", encoding="utf-8") as f:
-                    self.ignore_patterns += [ln.strip() for ln in f if ln.strip() and not ln.startswith("#")]
+                    for raw in f:
+                        ln = raw.strip()
+                        if not ln or ln.startswith("#"):
+                            continue
+                        self.ignore_patterns.append(ln)
             except Exception as e:
                 logger.warning("Could not read .fixignore: %s", e)
+        self._compile_ignore_patterns()
+
+    def _compile_ignore_patterns(self) -> None:
+        # gộp mọi glob thành một regex → mỗi path chỉ match một lần thay vì K lần fnmatch
+        self._ignore_dirs = tuple(p for p in self.ignore_patterns if p.endswith("/"))
+        globs = [fnmatch.translate(os.path.normcase(p)) for p in self.ignore_patterns]
+        self._ignore_re = re.compile("|".join(globs)) if globs else None
 
     def should_ignore_file(self, path: str, base_dir: str) -> bool:
         abs_path = os.path.abspath(path)
         if not abs_path.startswith(os.path.abspath(base_dir)): return True
         rel = os.path.relpath(abs_path, os.path.abspath(base_dir)).replace("\\","/")
-        for p in self.ignore_patterns:
-            if p.endswith("/") and (rel.startswith(p) or f"/{p}" in f"/{rel}/"): return True
-            if fnmatch.fnmatch(rel, p) or fnmatch.fnmatch(os.path.basename(path), p): return True
-        return False
+        if self._ignore_dirs:
+            wrapped = f"/{rel}/"
+            for p in self._ignore_dirs:
+                if rel.startswith(p) or f"/{p}" in wrapped: return True
+        m = self._ignore_re
+        if m is None: return False
+        return bool(m.match(os.path.normcase(rel)) or m.match(os.path.normcase(os.path.basename(path))))
 
     def fix_buggy_file(self, file_path: str, template_type: str, issues_data: List[RealBug]) -> FixResult:
         """
@@ -97,9 +236,11 @@ class SecureFixProcessor:
         start = datetime.now()
         input_tokens = output_tokens = total_tokens = 0
         rag_context = self.rag.search_context(issues_data) or ""
-        logger.debug(f"Fixer RAG retrieved context: {rag_context[:100]}")
+        logger.debug("Fixer RAG retrieved context: %s", rag_context[:100])
         original = ""
         final_content = ""
+        # True khi Serena đã ghi file trên đĩa → final_content đọc lại từ đó, không cần ghi lại
+        on_disk = False
         try:
             original = Path(file_path).read_text(encoding="utf-8") 
             # load template
@@ -109,7 +250,8 @@ class SecureFixProcessor:
             
             rendered = tpl(
                 original_code=original,
-                issues_log=json.dumps([asdict(b) if is_dataclass(b) else b for b in (issues_data or [])], ensure_ascii=False, indent=2),
+                # orjson serialize thẳng dataclass (RealBug), không cần asdict từng bug
+                issues_log=orjson.dumps(issues_data or [], option=orjson.OPT_INDENT_2, default=str).decode(),
                 rag_suggestion=rag_context,
                 has_rag_suggestion=bool(rag_context),
                 **tpl_vars,
@@ -120,7 +262,7 @@ class SecureFixProcessor:
             # === google-genai call ===
             resp = client.models.generate_content(model=GENERATION_MODEL, contents=rendered)
             text = getattr(resp, "text", "") or ""
-            logger.debug(f"Gemini response fix_buggy_file: {text[:100]}")
+            logger.debug("Gemini response fix_buggy_file: %s", text[:100])
 
             default_llm_file  = strip_markdown_code(text)
 
@@ -130,34 +272,41 @@ class SecureFixProcessor:
             fixed_code_block = sections.get("fixed_code_block")
 
             if serena_json:
-                logger.info(f"Applying Serena-based patches, preview: {serena_json[:200]}")
-                serena_applied = self._apply_serena_fixes(original, serena_json, file_path)
+                logger.info("Applying Serena-based patches, preview: %s", serena_json[:200])
+                serena_applied, patched = self._apply_serena_fixes(original, serena_json, file_path)
 
                 if serena_applied:
-                    try:
-                        logger.debug("Applied Serena patches")
-                        final_content = Path(file_path).read_text(encoding="utf-8")
-                    except Exception as e:
-                        logger.warning("Patched but could not read back file: %s", e)
+                    logger.debug("Applied Serena patches")
+                    if patched is not None:
+                        # chỉ có sửa in-process → đã có nội dung trong bộ nhớ, không đọc lại file
+                        final_content, on_disk = patched, True
+                    else:
+                        try:
+                            final_content = Path(file_path).read_text(encoding="utf-8")
+                            on_disk = True
+                        except Exception as e:
+                            logger.warning("Patched but could not read back file: %s", e)
                 else:
                     if fixed_code_block:
                         final_content = strip_markdown_code(fixed_code_block)
-                        logger.debug(f"Fixed code block preview: {fixed_code_block[:100]}")
+                        logger.debug("Fixed code block preview: %s", fixed_code_block[:100])
                         logger.info("Serena returned no changes; fallback to LLM full-file replacement")
                     else:
                         logger.error("No fixed code in LLM response")
                         final_content = default_llm_file
             elif fixed_code_block:
                 final_content = strip_markdown_code(fixed_code_block)
-                logger.debug(f"Fixed code block preview: {fixed_code_block[:100]}")
+                logger.debug("Fixed code block preview: %s", fixed_code_block[:100])
                 logger.info("No serena instruction returned; fallback to LLM full-file replacement")
             else:
                 logger.warning("No serena instruction and fixed code in LLM response")
                 final_content = default_llm_file
 
             if final_content:
-                logger.debug(f"Final content: {final_content[:100]}")
-                Path(file_path).write_text(final_content, encoding="utf-8")
+                logger.debug("Final content: %s", final_content[:100])
+                if not on_disk:
+                    _atomic_write_text(file_path, final_content)
+                    serena_runner.invalidate()  # session Serena dùng chung không được đọc bản cũ
 
             else:
                 raise RuntimeError("No valid fixed content produced") 
@@ -222,39 +371,36 @@ class SecureFixProcessor:
         s = s.strip().replace("\r\n", "\n").replace("\r", "\n")
 
         # 1) Strip outer code fences if present
-        s = re.sub(r"^```(?:json|yaml)?\s*", "", s, flags=re.IGNORECASE)
-        s = re.sub(r"\s*```$", "", s)
+        s = _FENCE_OPEN_RE.sub("", s)
+        s = _FENCE_CLOSE_RE.sub("", s)
 
         # 2) Extract JSON between markers if present
-        m = re.search(rf"{re.escape(MARKER_START)}\s*(.*?)\s*{re.escape(MARKER_END)}", s, re.DOTALL)
+        m = _MARKER_BLOCK_RE.search(s)
         if m:
             s = m.group(1).strip()
 
         # 3) Normalize smart quotes
-        s = (s.replace("\u201c", '"')
-            .replace("\u201d", '"')
-            .replace("\u2018", "'")
-            .replace("\u2019", "'"))
+        s = s.translate(_SMART_QUOTES)
 
         # 4) Remove trailing commas before } or ]
-        s = re.sub(r",(\s*[}\]])", r"\1", s)
+        s = _TRAILING_COMMA_RE.sub(r"\1", s)
 
         return s
     
     def _extract_sections(self, llm_response: str) -> Dict[str, Optional[str]]:
         """Extract Serena JSON, Change Log, and Fixed Code by hard markers."""
         def grab(start: str, end: str) -> Optional[str]:
-            if start not in llm_response or end not in llm_response:
+            i = llm_response.find(start)
+            if i == -1:
                 return None
-            s = llm_response.find(start) + len(start)
+            s = i + len(start)
             e = llm_response.find(end, s)
             if e == -1 or s >= e:
                 return None
             return llm_response[s:e].strip()
 
         return {
-            "serena_json": grab("=== SERENA FIX INSTRUCTIONS START ===",
-                                "=== SERENA FIX INSTRUCTIONS END ==="),
+            "serena_json": grab(MARKER_START, MARKER_END),
             "change_log": grab("=== CHANGE LOG START ===",
                             "=== CHANGE LOG END ==="),
             "fixed_code_block": grab("=== FIXED SOURCE CODE START ===",
@@ -279,15 +425,7 @@ class SecureFixProcessor:
         payload = self._clean_instruction_block(instructions)
         if not payload:
             raise ValueError("Empty Serena instructions")
-        
-        try:
-            return json.loads(payload)
-        except Exception:
-            try:
-                import yaml  # optional
-                return yaml.safe_load(payload)
-            except Exception:
-                raise ValueError("Serena instructions must be JSON or YAML")
+        return _load_instruction_payload(payload)
 
     def _norm_regex_flags(self, flags: Any) -> Optional[int]:
         """Chuyển flags từ 'MULTILINE' | 'M' | ['MULTILINE','IGNORECASE'] | int → int bitmask."""
@@ -297,7 +435,7 @@ class SecureFixProcessor:
             return flags
         parts: List[str]
         if isinstance(flags, str):
-            parts = re.split(r"[|,\s]+", flags.strip())
+            parts = _FLAG_SPLIT_RE.split(flags.strip())
         elif isinstance(flags, list):
             parts = [str(x) for x in flags]
         else:
@@ -313,107 +451,165 @@ class SecureFixProcessor:
                 logger.warning("Unknown regex flag: %s", p) if hasattr(self, "logger") else None
         return val or None
 
-    async def _run_serena_steps(self, project_root: str, steps: list) -> int:
-        """Trả về số step áp dụng thành công."""
-        from src.app.adapters.serena_client import SerenaClient, SerenaError  # tránh import vòng
-        applied = 0
-        async with SerenaClient(project_path=project_root) as sc:
+    async def _run_serena_steps(
+        self, project_root: str, steps: list, writes: Optional[List[Tuple[str, str, int]]] = None,
+    ) -> int:
+        """Trả về số step áp dụng thành công.
+
+        writes: [(path, content, n_steps)] — nội dung đã áp regex sẵn ở client, ghi 1 lần/file.
+        """
+        from src.app.adapters.serena_client import SerenaError  # tránh import vòng
+        # session dùng chung cả batch (serena_runner giữ kết nối, đóng ở close())
+        sc = await serena_runner.get_client(project_root)
+
+        # tool list chỉ ảnh hưởng tới op "exec" → chỉ lấy khi thật sự cần
+        tools: List[str] = []
+        if any((st.get("op") or "").lower() == "exec" for st in steps):
             tools = await sc.list_tools()
-            logger.debug("Serena tools: %s", tools) if hasattr(self, "logger") else None
 
-            for idx, step in enumerate(steps, start=1):
-                op = (step.get("op") or "").lower()
+        async def write(path: str, content: str, n_steps: int) -> int:
+            try:
+                await sc.create_text_file(path=path, content=content)
+                return n_steps
+            except SerenaError as e:
+                logger.error("Serena write of %s failed: %s", path, e, exc_info=True)
+                return 0
+
+        # mỗi việc: (file chạm tới | None = exec/không rõ → chặn toàn bộ, coroutine factory)
+        jobs: List[Tuple[Optional[str], Any]] = [
+            (os.path.normpath(path), functools.partial(write, path, content, n_steps))
+            for path, content, n_steps in writes or []
+        ]
+        for idx, step in enumerate(steps, start=1):
+            jobs.append((_step_file(step), functools.partial(self._run_step, sc, tools, idx, step)))
+
+        # các step khác file chạy song song trong cùng wave; cùng file / exec giữ nguyên thứ tự
+        applied = 0
+        for wave in _schedule_waves([f for f, _ in jobs]):
+            results = await asyncio.gather(*(jobs[i][1]() for i in wave))
+            applied += sum(results)
+        return applied
+
+    async def _run_step(self, sc, tools: List[str], idx: int, step: Dict[str, Any]) -> int:
+        """Chạy 1 step qua Serena; trả 1 nếu áp dụng, 0 nếu bỏ qua/lỗi (đã log)."""
+        from src.app.adapters.serena_client import SerenaError  # tránh import vòng
+        op = (step.get("op") or "").lower()
+        try:
+            # chuẩn hoá số liệu
+            if op == "regex_replace":
+                # flags → int
+                norm = self._norm_regex_flags(step.get("flags"))
+                if norm is not None:
+                    step["flags"] = norm
+                # compile thử để bắt pattern lỗi sớm
                 try:
-                    # chuẩn hoá số liệu
-                    if op == "regex_replace":
-                        # flags → int
-                        norm = self._norm_regex_flags(step.get("flags"))
-                        if norm is not None:
-                            step["flags"] = norm
-                        # compile thử để bắt pattern lỗi sớm
-                        try:
-                            re.compile(step["pattern"], norm or 0)
-                        except re.error as e:
-                            logger.error("Invalid regex at step %d: %s", idx, e)
-                            continue
+                    _compiled_regex(step["pattern"], norm or 0)
+                except re.error as e:
+                    logger.error("Invalid regex at step %d: %s", idx, e)
+                    return 0
+
+                await sc.apply_patch_by_regex(
+                    path=step["path"],
+                    pattern=step["pattern"],
+                    replacement=step["replacement"],
+                    count=step.get("count"),
+                    flags=step.get("flags"),  # đã là int
+                )
+                return 1
+
+            if op in _STEP_CALLS:
+                await _STEP_CALLS[op](sc, step)
+                return 1
+
+            if op == "exec":
+                # chỉ chạy nếu tool có mặt (tránh fail ở build Serena không expose tool này)
+                if "execute_shell_command" in tools:
+                    await sc.execute_shell_command(
+                        command=step["command"],
+                        timeout_s=step.get("timeout_s", 300),
+                        cwd=step.get("cwd"),
+                        env=step.get("env"),
+                        shell=step.get("shell"),
+                    )
+                else:
+                    logger.info("Skip exec: execute_shell_command not exposed")
+                return 0
 
-                        await sc.apply_patch_by_regex(
-                            path=step["path"],
-                            pattern=step["pattern"],
-                            replacement=step["replacement"],
-                            count=step.get("count"),
-                            flags=step.get("flags"),  # đã là int
-                        )
-                        applied += 1
-
-                    elif op == "replace_symbol_body":
-                        await sc.apply_patch_by_symbol(
-                            name_path=step["name_path"],
-                            relative_path=step.get("relative_path") or step.get("path") or "",
-                            new_body=step["new_body"],
-                        )
-                        applied += 1
-
-                    elif op == "replace_lines":
-                        await sc.replace_lines(
-                            path=step["path"],
-                            start_line=int(step["start_line"]),
-                            end_line=int(step["end_line"]),
-                            new_text=step["new_text"],
-                        )
-                        applied += 1
-
-                    elif op == "insert_before_symbol":
-                        await sc.insert_before_symbol(
-                            name_path=step["name_path"],
-                            relative_path=step.get("relative_path") or step.get("path") or "",
-                            text=step["text"],
-                        )
-                        applied += 1
-
-                    elif op == "insert_after_symbol":
-                        await sc.insert_after_symbol(
-                            name_path=step["name_path"],
-                            relative_path=step.get("relative_path") or step.get("path") or "",
-                            text=step["text"],
-                        )
-                        applied += 1
-
-                    elif op == "exec":
-                        # chỉ chạy nếu tool có mặt (tránh fail ở build Serena không expose tool này)
-                        if "execute_shell_command" in tools:
-                            await sc.execute_shell_command(
-                                command=step["command"],
-                                timeout_s=step.get("timeout_s", 300),
-                                cwd=step.get("cwd"),
-                                env=step.get("env"),
-                                shell=step.get("shell"),
-                            )
-                        else:
-                            logger.info("Skip exec: execute_shell_command not exposed")
-                    else:
-                        logger.warning("Unknown Serena op at step %d: %s", idx, op)
+            logger.warning("Unknown Serena op at step %d: %s", idx, op)
+        except SerenaError as e:
+            # log đầy đủ và sang step kế tiếp
+            logger.error("Serena step %d (%s) failed: %s", idx, op, e, exc_info=True)
+        except Exception as e:
+            logger.error("Unexpected error at step %d (%s): %s", idx, op, e, exc_info=True)
+        return 0
 
-                except SerenaError as e:
-                    # log đầy đủ và sang step kế tiếp
-                    logger.error("Serena step %d (%s) failed: %s", idx, op, e, exc_info=True)
-                except Exception as e:
-                    logger.error("Unexpected error at step %d (%s): %s", idx, op, e, exc_info=True)
+    def _regex_only_steps(
+        self, project_root: str, steps: list, file_path: str,
+    ) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+        """(path, steps) nếu mọi step chạm tới file đang fix đều là regex_replace; ngược lại None.
 
-        return applied
+        Có op khác trên cùng file hoặc có exec thì giữ nguyên thứ tự gửi Serena. Kể cả khi trả
+        (path, steps), bypass chỉ được dùng nếu _apply_regex_steps xác nhận kết quả giống Serena.
+        """
+        target = Path(file_path).resolve()
+        rel: Optional[str] = None
+        regex_steps: List[Dict[str, Any]] = []
+        for st in steps:
+            op = (st.get("op") or "").lower()
+            if op == "exec":
+                return None
+            p = st.get("path") or st.get("relative_path")
+            if not p or Path(project_root, p).resolve() != target:
+                continue
+            if op != "regex_replace":
+                return None
+            rel = p
+            regex_steps.append(st)
+        return (rel, regex_steps) if rel else None
+
+    def _apply_regex_steps(self, content: str, steps: List[Dict[str, Any]]) -> Optional[Tuple[str, int]]:
+        """Áp lần lượt các regex_replace lên content theo đúng luật replace_regex của Serena.
+
+        Trả (content mới, số step đã áp); None nếu có step không chứng minh được là cho kết quả
+        giống Serena (pattern lỗi, không match / match nhiều lần, có flags/count) → để Serena áp.
+        """
+        for idx, st in enumerate(steps, start=1):
+            # flags/count không có trong schema replace_regex của Serena → không tự diễn giải
+            if st.get("flags") or st.get("count"):
+                return None
+            try:
+                out = _serena_regex_sub(content, st["pattern"], st.get("replacement", ""))
+            except (re.error, KeyError, IndexError, TypeError) as e:
+                logger.error("Invalid regex step %d: %s", idx, e)
+                return None
+            if out is None:
+                logger.info("Regex step %d does not match exactly once; deferring to Serena", idx)
+                return None
+            content = out
+        return content, len(steps)
+
+    def _apply_serena_fixes(
+        self, original_code: str, instructions: str, file_path: str,
+    ) -> Tuple[bool, Optional[str]]:
+        """Áp các step Serena. Trả (đã áp dụng?, nội dung file nếu biết sẵn trong bộ nhớ).
 
-    def _apply_serena_fixes(self, original_code: str, instructions: str, file_path: str) -> Optional[str]:
+        Nội dung chỉ có khi mọi thay đổi được áp in-process; step chạy qua Serena → None (cần đọc lại file).
+        """
         try:
             payload = self._parse_instructions(instructions)
             project_root = payload.get("project_root") or self._repo_root_guess()
             steps = payload.get("steps") or []
             if not steps:
                 logger.info("No steps in Serena instructions")
-                return None
+                return False, None
 
             # Bảo vệ path: ép về tương đối, tránh thoát root
             fixed_steps = []
-            for st in steps:
+            for idx, st in enumerate(steps, start=1):
+                # lọc op lạ trước khi mở session Serena
+                if (st.get("op") or "").lower() not in _KNOWN_OPS:
+                    logger.warning("Unknown Serena op at step %d: %s", idx, st.get("op"))
+                    continue
                 st = dict(st)  # copy
                 p = st.get("path")
                 if p:
@@ -426,10 +622,43 @@ class SecureFixProcessor:
                     st["relative_path"] = str(Path(abs_rp).relative_to(project_root))
                 fixed_steps.append(st)
 
-            import asyncio
-            applied = asyncio.run(self._run_serena_steps(project_root, fixed_steps))
+            if not fixed_steps:
+                logger.info("No applicable steps in Serena instructions")
+                return False, None
+
+            # regex_replace trên chính file đang fix → áp dụng trên original_code, gửi 1 lần ghi.
+            # Chỉ đi đường này khi mọi step cho kết quả giống hệt replace_regex của Serena.
+            writes: List[Tuple[str, str, int]] = []
+            local_applied = 0
+            local_code: Optional[str] = None
+            local = self._regex_only_steps(project_root, fixed_steps, file_path)
+            local_out = self._apply_regex_steps(original_code, local[1]) if local else None
+            if local_out is not None:
+                rel, regex_steps = local
+                new_code, n_applied = local_out
+                done = {id(r) for r in regex_steps}
+                fixed_steps = [st for st in fixed_steps if id(st) not in done]
+                if n_applied and new_code != original_code:
+                    # không còn step Serena, hoặc file lớn (tránh encode cả file vào JSON-RPC)
+                    # → ghi thẳng xuống đĩa; ngược lại gửi 1 create_text_file qua session
+                    if not fixed_steps or len(new_code) > _INLINE_WRITE_MAX:
+                        _atomic_write_text(file_path, new_code)
+                        serena_runner.invalidate()
+                        local_applied = n_applied
+                        local_code = new_code
+                        logger.info("Applied %d regex step(s) in-process", n_applied)
+                    else:
+                        writes.append((rel, new_code, n_applied))
+
+            if not fixed_steps:
+                if local_applied:
+                    return True, local_code
+                logger.info("Serena regex steps produced no changes")
+                return False, None
+
+            applied = local_applied + serena_runner.run(self._run_serena_steps(project_root, fixed_steps, writes))
 
-            return "OK" if applied > 0 else None
+            return applied > 0, None
         except Exception as e:
             logger.error("Apply Serena fixes failed: %s", e, exc_info=True)
-            return None
\ No newline at end of file
+            return False, None
\ No newline at end of file
@@ -8,6 +8,9 @@ from src.app.services.rag_service import RAGService
 from src.app.services.batch_fix.models import FixResult
 from src.app.services.log_service import logger
 
+# số nguồn RAG thực sự ghép vào prompt; search chỉ xin đúng số này
+_CONTEXT_TOP_K = 3
+
 def build_query_and_filters_from_issues(issues_data: List[RealBug]) -> Tuple[str, Dict[str, str]]:
     """
     Build a concise query string and filters from a collection of issues for Fixer RAG search.
@@ -102,14 +105,14 @@ class RAGAdapter:
             return None
 
         # Gọi đúng endpoint /fixer-rag/search
-        res = self.svc.search_fixer(query=query, limit=8, filters=filters)
+        res = self.svc.search_fixer(query=query, limit=_CONTEXT_TOP_K, filters=filters)
         if not (res.success and res.sources):
             logger.debug("Search fixer RAG failed, return: %s", {res.error_message or "No source found"})
             return None
 
         # Ghép thành đoạn context ngắn gọn cho prompt
         parts = ["\n=== RELEVANT CONTEXT FROM FIXER RAG ==="]
-        for i, src in enumerate(res.sources[:3], 1):
+        for i, src in enumerate(res.sources[:_CONTEXT_TOP_K], 1):
             content = str(src.get("content", ""))[:400]
             sim = float(src.get("similarity_score", src.get("similarity", 0.0)) or 0.0)
             parts.append(f"\n{i}. Similar Item (Similarity: {sim:.2f}):")
@@ -118,7 +121,7 @@ class RAGAdapter:
             if md.get("code_language"):
                 parts.append(f"Language: {md['code_language']}")
         parts.append("\n=== END OF RAG CONTEXT ===\n")
-        logger.debug(f"Retrieved context for prompt: {parts}")
+        logger.debug("Retrieved context for prompt: %s", parts)
         return "\n".join(parts)
 
     def add_fix(self, fix_result: FixResult, issues_data: List[RealBug], fixed_code: str) -> bool:
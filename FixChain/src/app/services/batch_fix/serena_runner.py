@@ -0,0 +1,148 @@
+# src/app/services/batch_fix/serena_runner.py
+from __future__ import annotations
+import asyncio
+import concurrent.futures
+import os
+import threading
+from typing import TYPE_CHECKING, Any, Awaitable, Optional
+from src.app.services.log_service import logger
+
+if TYPE_CHECKING:
+    from src.app.adapters.serena_client import SerenaClient
+
+# Một event loop chạy nền cho cả batch: các coroutine Serena được submit vào đây
+# thay vì mỗi file lại asyncio.run() (tạo + huỷ loop mới mỗi lần).
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_thread: Optional[threading.Thread] = None
+_lock = threading.Lock()
+# timeout tổng cho một lượt chạy step của 1 file (exec có thể tới vài phút)
+DEFAULT_TIMEOUT_S = float(os.getenv("SERENA_RUN_TIMEOUT_S", "600"))
+CLOSE_TIMEOUT_S = 10.0
+
+# Session Serena dùng chung cho cả batch. sse_client/ClientSession (anyio) phải được
+# enter/exit trong cùng một task → một task "chủ" giữ `async with` cho tới khi có stop.
+_client: Optional["SerenaClient"] = None
+_client_key: Optional[str] = None
+_client_task: Optional[asyncio.Task] = None
+_client_ready: Optional[asyncio.Future] = None
+_client_stop: Optional[asyncio.Event] = None
+# tạo lazy trên loop nền; giữ trong lúc đóng/mở session để 2 coroutine không cùng mở kết nối
+_start_lock: Optional[asyncio.Lock] = None
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop, _thread
+    if _loop is None:
+        with _lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                t = threading.Thread(target=loop.run_forever, name="serena-loop", daemon=True)
+                t.start()
+                _loop, _thread = loop, t
+                logger.debug("Started Serena background event loop")
+    return _loop
+
+
+def run(coro: Awaitable[Any], timeout: Optional[float] = DEFAULT_TIMEOUT_S) -> Any:
+    """Chạy coroutine trên loop nền và chờ kết quả (gọi từ code sync).
+
+    Quá timeout → huỷ task trên loop (không để coroutine treo chạy tiếp) và raise TimeoutError.
+    """
+    fut = asyncio.run_coroutine_threadsafe(coro, _get_loop())
+    try:
+        return fut.result(timeout=timeout)
+    except concurrent.futures.TimeoutError:
+        fut.cancel()
+        raise TimeoutError(f"Serena run exceeded {timeout}s") from None
+
+
+async def _own_client(project_path: str, ready: asyncio.Future, stop: asyncio.Event) -> None:
+    global _client
+    from src.app.adapters.serena_client import SerenaClient  # mcp chỉ cần khi thật sự dùng Serena
+    sc = SerenaClient(project_path=project_path)
+    try:
+        async with sc:
+            _client = sc
+            ready.set_result(sc)
+            await stop.wait()
+    except asyncio.CancelledError:
+        if not ready.done():
+            ready.cancel()
+        raise
+    except Exception as e:
+        if not ready.done():
+            ready.set_exception(e)
+        else:
+            logger.warning("Serena session closed with error: %s", e)
+    finally:
+        if _client is sc:
+            _client = None
+
+
+async def get_client(project_path: str) -> "SerenaClient":
+    """Trả session Serena đang mở (mở mới nếu chưa có / đã chết / đổi project). Gọi trên loop nền."""
+    global _client_key, _client_task, _client_ready, _client_stop, _start_lock
+    if _start_lock is None:
+        _start_lock = asyncio.Lock()
+    async with _start_lock:
+        stale = _client is not None and not _client.healthy  # tool call trước bị timeout
+        if _client_task is not None and (_client_task.done() or _client_key != project_path or stale):
+            if stale:
+                logger.warning("Serena session timed out earlier; reconnecting")
+            await _close_client()
+        if _client_task is None:
+            loop = asyncio.get_running_loop()
+            _client_ready = loop.create_future()
+            _client_stop = asyncio.Event()
+            _client_key = project_path
+            _client_task = loop.create_task(_own_client(project_path, _client_ready, _client_stop))
+        ready = _client_ready
+    assert ready is not None
+    # shield: caller bị huỷ (timeout) không được huỷ luôn future dùng chung.
+    # Kết nối lỗi → task chủ kết thúc → lần gọi sau thấy done() và mở lại.
+    return await asyncio.shield(ready)
+
+
+async def _close_client() -> None:
+    global _client_key, _client_task, _client_ready, _client_stop
+    task, stop = _client_task, _client_stop
+    _client_key = _client_task = _client_ready = _client_stop = None
+    if task is None or task.done():
+        return
+    if stop is not None:
+        stop.set()
+    try:
+        await asyncio.wait_for(task, timeout=CLOSE_TIMEOUT_S)
+    except asyncio.TimeoutError:
+        logger.warning("Serena session did not close within %ss", CLOSE_TIMEOUT_S)
+    except Exception as e:
+        logger.debug("Serena session close: %s", e)
+
+
+def invalidate() -> None:
+    """File bị sửa ngoài Serena (ghi local) → bỏ cache đọc của session đang mở."""
+    loop, sc = _loop, _client
+    if loop is not None and sc is not None:
+        loop.call_soon_threadsafe(sc.invalidate)
+
+
+def shutdown() -> None:
+    """Đóng session Serena và dừng loop nền (gọi khi kết thúc batch)."""
+    global _loop, _thread, _start_lock
+    with _lock:
+        loop, t = _loop, _thread
+        _loop = _thread = None
+    _start_lock = None  # Lock gắn với loop cũ
+    if loop is None:
+        return
+    if _client_task is not None:
+        fut = asyncio.run_coroutine_threadsafe(_close_client(), loop)
+        try:
+            fut.result(timeout=CLOSE_TIMEOUT_S + 1)
+        except Exception as e:
+            logger.warning("Could not close Serena session cleanly: %s", e)
+    loop.call_soon_threadsafe(loop.stop)
+    if t is not None:
+        t.join(timeout=5)
+    if not loop.is_running():
+        loop.close()
@@ -18,7 +18,9 @@ class TemplateManager:
         self.env = Environment(loader=FileSystemLoader(self.prompt_dir))
         ts = datetime.now().strftime("%m%d_%H%M%S")
         self._log_file = os.path.join(os.getenv("LOG_DIR","logs"), f"template_usage_{ts}.log")
-        os.makedirs(os.path.dirname(self._log_file), exist_ok=True)
+        self._log_dir_ready = False  # tạo thư mục log khi ghi lần đầu, không phải lúc khởi tạo
+        # template_type -> render callable; mỗi file chỉ stat/compile một lần cho cả batch
+        self._cache: Dict[str, Any] = {}
 
     def load(self, template_type: str):
         files = {
@@ -27,12 +29,21 @@ class TemplateManager:
         }
 
         fname = files.get(template_type, "fix.j2")
-        path = os.path.join(self.prompt_dir, fname)
-        if not os.path.exists(path): 
-            return None, {}
-        template = self.env.get_template(fname)
-        logger.debug(f"Get template: {template}")
-        return template.render, {}
+        render = self._cache.get(fname)
+        if render is None:
+            path = os.path.join(self.prompt_dir, fname)
+            if not os.path.exists(path): 
+                return None, {}
+            template = self.env.get_template(fname)
+            logger.debug("Get template: %s", template)
+            render = self._cache[fname] = template.render
+        return render, {}
+
+    def _open_log(self):
+        if not self._log_dir_ready:
+            os.makedirs(os.path.dirname(self._log_file), exist_ok=True)
+            self._log_dir_ready = True
+        return open(self._log_file, "a", encoding="utf-8")
 
     def log_template_usage(self, file_path: str, template_type: str, rendered_prompt: str) -> None:
         data = {
@@ -41,9 +52,9 @@ class TemplateManager:
             "prompt_length": len(rendered_prompt),
             "prompt_preview": rendered_prompt[:100]
         }
-        logger.debug(f"Template data: {data}")
+        logger.debug("Template data: %s", data)
         try:
-            with open(self._log_file, "a", encoding="utf-8") as f:
+            with self._open_log() as f:
                 f.write("TEMPLATE_USAGE " + json.dumps(data, ensure_ascii=False) + "\n")
                 logger.debug("Writing template usage")
         except Exception as e:
@@ -57,22 +68,24 @@ class TemplateManager:
             "response_preview": fixed_candidate
         }
         try:
-            with open(self._log_file, "a", encoding="utf-8") as f:
+            with self._open_log() as f:
                 f.write("AI_RESPONSE " + json.dumps(data, ensure_ascii=False) + "\n")
-                logger.debug(f"AI response: {data}")
+                logger.debug("AI response: %s", data)
         except Exception as e:
             logger.warning("Failed to write AI response log: %s", e)
 
 def strip_markdown_code(text: str) -> str:
-    s = text.strip()
-    if "## 3. Fixed Source Code" in s:
-        lines = s.splitlines()
-        idx = next((i for i,l in enumerate(lines) if "## 3. Fixed Source Code" in l), None)
-        if idx is not None: s = "\n".join(lines[idx+1:]).strip()
+    # cắt theo vị trí (find/rfind) trên một chuỗi, không tách list dòng rồi join lại
+    s = text.strip().replace("\r\n", "\n").replace("\r", "\n")
+    i = s.find("## 3. Fixed Source Code")
+    if i != -1:
+        nl = s.find("\n", i)
+        s = s[nl+1:].strip() if nl != -1 else ""
     if s.startswith("```"):
-        lines = s.splitlines()
-        lines = lines[1:] if lines and lines[0].startswith("```") else lines
-        if lines and lines[-1].strip()=="```": lines = lines[:-1]
-        s = "\n".join(lines)
-    logger.debug(f"strip_markdown_code return: {s.strip()[:200]}...")
-    return s.strip()
+        nl = s.find("\n")
+        s = s[nl+1:] if nl != -1 else ""
+        nl = s.rfind("\n")
+        if s[nl+1:].strip() == "```": s = s[:nl] if nl != -1 else ""
+    s = s.strip()
+    logger.debug("strip_markdown_code return: %s...", s[:200])
+    return s
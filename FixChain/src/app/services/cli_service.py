@@ -1,9 +1,13 @@
 from __future__ import annotations
 from typing import Optional, Sequence
 import subprocess
+import threading
 import re
 from src.app.services.log_service import logger
 
+# 1 dòng (kèm \n nếu có) sau khi chuẩn hoá \r → \n
+_CR_SPLIT_RE = re.compile(r"[^\n]*\n|[^\n]+$")
+
 class CLIService:
     """Helper service for running CLI commands with logging."""
 
@@ -13,9 +17,12 @@ class CLIService:
         cwd: Optional[str] = None,
         env: Optional[dict] = None,
         shell: bool = False,
+        input_data: Optional[bytes] = None,
     ) -> tuple[bool, list[str]]:
         """Run a command and stream its output line by line.
 
+        If ``input_data`` is given it is written to the child's stdin (then closed).
+
         Returns:
             tuple[bool, list[str]]: Success flag and list of captured output lines.
         """
@@ -27,12 +34,23 @@ class CLIService:
                 shell=shell,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.STDOUT,
-                text=True,
-                encoding="utf-8",
+                stdin=subprocess.PIPE if input_data is not None else None,
+                bufsize=65536,  # đọc pipe theo khối 64 KiB thay vì 8 KiB mặc định
             )
             assert process.stdout is not None
-            for line in process.stdout:
-                output_lines.append(line)
+            if input_data is not None:
+                # ghi stdin ở thread riêng để không deadlock khi child vừa đọc vừa ghi stdout
+                threading.Thread(
+                    target=CLIService._feed_stdin, args=(process.stdin, input_data), daemon=True
+                ).start()
+            # Đọc pipe ở chế độ bytes, chỉ decode từng dòng khi trả ra ngoài (giữ API list[str])
+            for raw in process.stdout:
+                line = raw.decode("utf-8", errors="replace")
+                if "\r" in line:
+                    # universal newlines như pipe text-mode cũ: \r\n và \r đơn (progress) đều là hết dòng
+                    output_lines.extend(_CR_SPLIT_RE.findall(line.replace("\r\n", "\n").replace("\r", "\n")))
+                else:
+                    output_lines.append(line)
                 # try:
                 #     # Clean ANSI escape sequences and handle Unicode characters
                 #     clean_line = line.strip()
@@ -54,3 +72,15 @@ class CLIService:
         except Exception as e:
             logger.error(f"Error running command {command}: {e}")
             return False, output_lines
+
+    @staticmethod
+    def _feed_stdin(stdin, data: bytes) -> None:
+        try:
+            stdin.write(data)
+        except (BrokenPipeError, OSError) as e:
+            logger.warning("stdin closed early: %s", e)
+        finally:
+            try:
+                stdin.close()
+            except OSError:
+                pass
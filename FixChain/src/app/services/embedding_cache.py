@@ -0,0 +1,191 @@
+# src/app/services/embedding_cache.py
+"""
+Cache cho /search:
+- Embedding của query: LRU trong process, khoá sha256(model + query đã chuẩn hoá khoảng trắng),
+  thêm Mongo collection (TTL) để các worker/process khác cũng hit được → query lặp lại không gọi Gemini nữa.
+- Kết quả search (semantic): query có embedding gần (cosine ≥ ngưỡng) với query đã search trong cùng
+  scope (collection, filters, top_k) → trả lại kết quả cũ, bỏ qua bước search trên Mongo.
+Document import/update lưu content_hash cạnh embedding → content không đổi thì không embed lại.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import orjson
+
+from src.app.adapters.llm.google_genai import EMBEDDING_MODEL
+from src.app.repositories.mongo import get_mongo_manager, now_utc
+from src.app.services.log_service import logger
+
+QUERY_CACHE_COLLECTION = os.getenv("QUERY_CACHE_COLLECTION", "query_embedding_cache")
+_QUERY_CACHE_MAX = int(os.getenv("QUERY_EMBEDDING_CACHE_MAX", "1024"))
+_QUERY_CACHE_TTL_S = int(os.getenv("QUERY_EMBEDDING_CACHE_TTL_S", "86400"))
+
+_SEARCH_CACHE_THRESHOLD = float(os.getenv("SEARCH_CACHE_THRESHOLD", "0.95"))
+# kết quả có thể cũ tối đa TTL giây nếu collection bị ghi ngoài các route import/update của API
+_SEARCH_CACHE_TTL_S = float(os.getenv("SEARCH_CACHE_TTL_S", "300"))
+_SEARCH_CACHE_MAX = int(os.getenv("SEARCH_CACHE_MAX", "256"))
+
+_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+# route sync chạy trong threadpool → khoá khi đọc/ghi LRU
+_cache_lock = threading.Lock()
+_ttl_index_ready = False
+
+# id → (scope, hết hạn lúc [monotonic], embedding đã chuẩn hoá L2, kết quả)
+_search_cache: "OrderedDict[int, Tuple[Tuple[str, str, int], float, np.ndarray, List[Dict[str, Any]]]]" = OrderedDict()
+_search_cache_lock = threading.Lock()
+_search_cache_seq = 0
+
+
+def content_hash(text: str) -> str:
+    """sha256(model + text); đổi EMBEDDING_MODEL → hash đổi → embedding cũ không bị dùng lại."""
+    return hashlib.sha256(f"{EMBEDDING_MODEL}\x00{text}".encode("utf-8")).hexdigest()
+
+
+def stored_content_hashes(col, field: str, keys: Iterable[Any]) -> Dict[Any, str]:
+    """
+    content_hash đang lưu của các document có `field` thuộc keys (chỉ kéo 2 field, không kéo embedding).
+    Lỗi → {} (coi như chưa có gì, embed lại toàn bộ).
+    """
+    try:
+        keys = [k for k in set(keys) if k]
+        if not keys:
+            return {}
+        cursor = col.find({field: {"$in": keys}, "content_hash": {"$ne": None}}, {"_id": 0, field: 1, "content_hash": 1})
+        return {d[field]: d["content_hash"] for d in cursor if field in d}
+    except Exception as e:
+        logger.debug("Content hash lookup failed: %s", e)
+        return {}
+
+
+def _query_key(text: str) -> str:
+    return content_hash(" ".join(text.split()))
+
+
+def _remember(key: str, emb: List[float]) -> None:
+    with _cache_lock:
+        _cache[key] = emb
+        _cache.move_to_end(key)
+        if len(_cache) > _QUERY_CACHE_MAX:
+            _cache.popitem(last=False)
+
+
+def _collection():
+    global _ttl_index_ready
+    col = get_mongo_manager().db[QUERY_CACHE_COLLECTION]
+    if not _ttl_index_ready:
+        # idempotent; Mongo tự xoá entry quá hạn
+        col.create_index("created_at", expireAfterSeconds=_QUERY_CACHE_TTL_S, name="idx_ttl_created_at")
+        _ttl_index_ready = True
+    return col
+
+
+def _load_persisted(key: str) -> Optional[List[float]]:
+    try:
+        doc = _collection().find_one({"_id": key}, {"embedding": 1})
+    except Exception as e:
+        logger.debug("Query embedding cache lookup failed: %s", e)
+        return None
+    return doc.get("embedding") if doc else None
+
+
+def _persist(key: str, text: str, emb: List[float]) -> None:
+    try:
+        _collection().update_one(
+            {"_id": key},
+            {"$set": {"text": text[:1000], "embedding": emb, "created_at": now_utc()}},
+            upsert=True,
+        )
+    except Exception as e:
+        logger.debug("Query embedding cache write failed: %s", e)
+
+
+def get_query_embedding(text: str, embed: Callable[[str], List[float]]) -> List[float]:
+    """
+    Embedding của `text`, lấy từ cache nếu có; miss → gọi `embed(text)` rồi lưu lại.
+    Vector toàn 0 (fallback khi Gemini trả rỗng) không được cache.
+    """
+    key = _query_key(text)
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit is not None:
+            _cache.move_to_end(key)
+            return hit
+
+    emb = _load_persisted(key)
+    if emb is None:
+        emb = embed(text)
+        if not any(emb):
+            return emb
+        _persist(key, text, emb)
+    _remember(key, emb)
+    return emb
+
+
+def _search_scope(collection: str, filters: Optional[Dict[str, Any]], top_k: int) -> Tuple[str, str, int]:
+    frozen = orjson.dumps(filters or {}, option=orjson.OPT_SORT_KEYS, default=str).decode()
+    return collection, frozen, int(top_k)
+
+
+def _unit(emb: List[float]) -> Optional[np.ndarray]:
+    v = np.asarray(emb, dtype=np.float32)
+    n = float(np.linalg.norm(v))
+    return v / n if n > 0 else None
+
+
+def get_cached_search(
+    collection: str, filters: Optional[Dict[str, Any]], top_k: int, emb: List[float]
+) -> Optional[List[Dict[str, Any]]]:
+    """Kết quả của query đã search gần nhất về ngữ nghĩa (cosine ≥ SEARCH_CACHE_THRESHOLD) trong cùng scope; None nếu miss."""
+    q = _unit(emb)
+    if q is None:
+        return None
+    scope = _search_scope(collection, filters, top_k)
+    now = time.monotonic()
+    with _search_cache_lock:
+        ids, vecs = [], []
+        for cid, (c_scope, expiry, vec, _) in list(_search_cache.items()):
+            if expiry <= now:
+                del _search_cache[cid]
+            elif c_scope == scope and vec.shape == q.shape:
+                ids.append(cid)
+                vecs.append(vec)
+        if not ids:
+            return None
+        sims = np.stack(vecs) @ q
+        best = int(np.argmax(sims))
+        if sims[best] < _SEARCH_CACHE_THRESHOLD:
+            return None
+        _search_cache.move_to_end(ids[best])
+        return _search_cache[ids[best]][3]
+
+
+def put_cached_search(
+    collection: str,
+    filters: Optional[Dict[str, Any]],
+    top_k: int,
+    emb: List[float],
+    results: List[Dict[str, Any]],
+) -> None:
+    global _search_cache_seq
+    q = _unit(emb)
+    if q is None:
+        return
+    entry = (_search_scope(collection, filters, top_k), time.monotonic() + _SEARCH_CACHE_TTL_S, q, results)
+    with _search_cache_lock:
+        _search_cache_seq += 1
+        _search_cache[_search_cache_seq] = entry
+        if len(_search_cache) > _SEARCH_CACHE_MAX:
+            _search_cache.popitem(last=False)
+
+
+def invalidate_search_cache(collection: str) -> None:
+    """Bỏ kết quả search đã cache của 1 collection (gọi sau khi ghi vào collection đó)."""
+    with _search_cache_lock:
+        for cid in [cid for cid, entry in _search_cache.items() if entry[0][0] == collection]:
+            del _search_cache[cid]
@@ -2,9 +2,10 @@ from __future__ import annotations
 
 import json
 import os
+from collections import Counter
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 from src.app.services.log_service import logger
 from src.app.services.analysis_service import AnalysisService
@@ -39,6 +40,8 @@ class ExecutionServiceNoMongo:
         self.scanner = BearerScanner(scan_directory=self.cfg.scan_directory)
         # Fixer: Gemini/LLM
         self.fixer = LLMFixer(self.cfg.scan_directory)
+        # path -> (mtime_ns, size, block đã format); chỉ đọc lại file đã đổi giữa các iteration
+        self._source_cache: Dict[str, Tuple[int, int, str]] = {}
 
     def _resolve_scan_root(self) -> str:
         """Chuẩn hoá đường dẫn scan, không phụ thuộc sys.path hack."""
@@ -58,17 +61,29 @@ class ExecutionServiceNoMongo:
                 return ""
 
             collected: List[str] = []
+            cache = self._source_cache
+            fresh: Dict[str, Tuple[int, int, str]] = {}
             logger.debug("Reading source code from directory: %s", base)
             for root, _dirs, files in os.walk(base):
                 for name in files:
                     if name.endswith((".py", ".js", ".jsx", ".ts", ".tsx", ".java", ".cpp", ".c", ".h")):
                         fp = os.path.join(root, name)
                         try:
-                            rel = os.path.relpath(fp, base).replace("\\", "/")
-                            content = open(fp, "r", encoding="utf-8").read()
-                            collected.append(f"// File: {rel}\n{content}\n\n")
+                            st = os.stat(fp)
+                            hit = cache.get(fp)
+                            if hit and hit[0] == st.st_mtime_ns and hit[1] == st.st_size:
+                                block = hit[2]
+                            else:
+                                rel = os.path.relpath(fp, base).replace("\\", "/")
+                                with open(fp, "r", encoding="utf-8") as f:
+                                    content = f.read()
+                                block = f"// File: {rel}\n{content}\n\n"
+                            fresh[fp] = (st.st_mtime_ns, st.st_size, block)
+                            collected.append(block)
                         except Exception as e:
                             logger.warning("Could not read %s: %s", fp, e)
+            # thay cache bằng snapshot mới → file bị xoá tự rơi khỏi cache
+            self._source_cache = fresh
             full_code = "".join(collected)
             return full_code
         except Exception as e:
@@ -77,12 +92,10 @@ class ExecutionServiceNoMongo:
 
     @staticmethod
     def _count_bug_types(bugs: List[Dict[str, str]]) -> Dict[str, int]:
-        counts: Dict[str, int] = {}
-        for b in bugs:
-            bug_type = str(b.get("severity", "")).upper()
-            counts[bug_type] = counts.get(bug_type, 0) + 1
-        counts["TOTAL"] = sum(v for k, v in counts.items() if k != "TOTAL")
-        return counts
+        counts = Counter(str(b.get("severity", "")).upper() for b in bugs)
+        # TOTAL = số bug có severity khác "TOTAL" (giữ nguyên ngữ nghĩa cũ)
+        counts["TOTAL"] = len(bugs) - counts["TOTAL"]
+        return dict(counts)
 
     def run(self) -> Dict[str, Any]:
         start = datetime.now()
@@ -150,7 +163,7 @@ class ExecutionServiceNoMongo:
             if isinstance(raw, str):
                 try:
                     fix_result = json.loads(raw.splitlines()[-1])
-                    logger.debug(f"Fix result: {fix_result}")
+                    logger.debug("Fix result: %s", fix_result)
                 except json.JSONDecodeError:
                     logger.error("Failed to parse fix result JSON")
                     fix_result = {"success": False, "fixed_count": 0, "error": "Invalid JSON output"}
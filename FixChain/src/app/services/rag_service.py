@@ -5,8 +5,10 @@ RAG Service client
 - Fixer: import/search/fix/suggest-fix
 """
 
+import json
 import os
 import time
+import orjson
 import requests
 from typing import Any, Dict, List, Optional
 from dataclasses import asdict, dataclass, field
@@ -14,6 +16,24 @@ from src.app.services.log_service import logger
 
 FIXER_COLLECTION = os.getenv("FIXER_RAG_COLLECTION", "fixer_rag_collection")
 
+_session: Optional[requests.Session] = None
+
+
+def _dump_body(payload: Any) -> bytes:
+    """JSON body cho request: orjson (key không phải str như json), kiểu orjson không nhận → json chuẩn."""
+    try:
+        return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+    except TypeError:
+        # vd. int vượt 64-bit, subclass lạ — serialize như requests json= trước đây
+        return json.dumps(payload).encode("utf-8")
+
+def _get_session() -> requests.Session:
+    """Session dùng chung cho mọi RAGService: giữ keep-alive tới RAG API thay vì mở TCP mới mỗi request."""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+    return _session
+
 # ---------- Data models ----------
 @dataclass
 class RAGSearchResult:
@@ -105,14 +125,18 @@ class RAGService:
         self.fixer_search = f"{self.base_url}/fixer-rag/search"
 
         self.headers = {"Content-Type": "application/json", "Accept": "application/json"}
+        self.session = _get_session()
 
     # ---------- Internal HTTP helper ----------
     def _post_with_retry(self, url: str, payload: Dict|List[Dict], retries: int = 2) -> requests.Response:
         last_exc: Optional[Exception] = None
+        # serialize 1 lần (orjson → bytes) và gửi lại cùng body khi retry,
+        # thay vì requests json= dumps lại payload ở mỗi lần thử
+        body = _dump_body(payload)
+        logger.debug("POST %s with payload: %s", url, payload)
         for i in range(retries + 1):
             try:
-                logger.debug("POST %s with payload: %s", url, str(payload))
-                resp = requests.post(url, json=payload, headers=self.headers, timeout=self.timeout)
+                resp = self.session.post(url, data=body, headers=self.headers, timeout=self.timeout)
                 if resp.ok:
                     return resp
                 if 500 <= resp.status_code < 600 and i < retries:
@@ -226,8 +250,8 @@ class RAGService:
     # ---------- Health ----------
     def health_check(self) -> bool:
         try:
-            s_ok = requests.get(self.scanner_health, headers=self.headers, timeout=5).ok
-            f_ok = requests.get(self.fixer_health,   headers=self.headers, timeout=5).ok
+            s_ok = self.session.get(self.scanner_health, headers=self.headers, timeout=5).ok
+            f_ok = self.session.get(self.fixer_health,   headers=self.headers, timeout=5).ok
             logger.info(f"RAG Health - Scanner: {'OK' if s_ok else 'FAIL'}, Fixer: {'OK' if f_ok else 'FAIL'}")
             return bool(s_ok and f_ok)
         except Exception:
@@ -0,0 +1,4 @@
+import os
+
+# module adapter Gemini kiểm tra key lúc import; test không gọi API thật
+os.environ.setdefault("GEMINI_API_KEY", "test")
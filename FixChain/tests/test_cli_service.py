@@ -0,0 +1,10 @@
+import subprocess
+
+from src.app.services.cli_service import CLIService
+
+
+def test_output_lines_match_text_mode_universal_newlines():
+    cmd = ["printf", "10%%\r50%%\rdone\r\nok\n\xc3\xa9\rtail"]
+    expected = subprocess.run(cmd, capture_output=True, text=True, encoding="utf-8").stdout.splitlines(keepends=True)
+    ok, lines = CLIService.run_command_stream(cmd)
+    assert ok and lines == expected
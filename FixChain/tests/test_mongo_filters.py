@@ -0,0 +1,37 @@
+import pytest
+
+from src.app.repositories.mongo import _metadata_filter
+
+
+def test_scalar_and_list_filters():
+    assert _metadata_filter({"severity": "HIGH", "rule_id": "r1", "project": ["a", "b"], "tags": ["x"]}) == {
+        "metadata.severity": {"$eq": "HIGH"},
+        "metadata.rule_id": {"$eq": "r1"},
+        "metadata.project": {"$eq": ["a", "b"]},
+        "metadata.tags": {"$eq": ["x"]},
+    }
+
+
+@pytest.mark.parametrize("filters", [
+    {"severity": {"$ne": None}},
+    {"$where": "1"},
+    {"a.b": "x"},
+    {"tags": "x"},
+    {"project": [{"$gt": ""}]},
+])
+def test_rejects_operators_and_non_scalar_values(filters):
+    with pytest.raises(ValueError):
+        _metadata_filter(filters)
+
+
+@pytest.mark.parametrize("code,msg,expected", [
+    (40324, "Unrecognized pipeline stage name: '$vectorSearch'", True),
+    (6047401, "$vectorSearch stage is only allowed on MongoDB Atlas", True),
+    (8, "PlanExecutor error: index 'bug_vec' not found on Atlas cluster", False),
+    (2, "Path 'metadata.severity' needs to be indexed as filter (Atlas Vector Search)", False),
+])
+def test_vector_stage_unsupported(code, msg, expected):
+    from pymongo.errors import OperationFailure
+    from src.app.repositories.mongo import _vector_stage_unsupported
+
+    assert _vector_stage_unsupported(OperationFailure(msg, code=code)) is expected
@@ -0,0 +1,108 @@
+"""regex_replace áp in-process phải cho đúng kết quả như khi gửi replace_regex qua Serena."""
+import asyncio
+import re
+
+import pytest
+
+from src.app.services.batch_fix import processor as P
+from src.app.services.batch_fix import serena_runner
+
+
+def _serena_replace_regex(content: str, regex: str, repl: str, allow_multiple_occurrences: bool = False) -> str:
+    # tái hiện ReplaceRegexTool của Serena: DOTALL|MULTILINE, backreference $!N, từ chối khi >1 match
+    compiled = re.compile(regex, re.DOTALL | re.MULTILINE)
+    n = len(compiled.findall(content))
+    if n == 0:
+        raise ValueError("no match")
+    if n > 1 and not allow_multiple_occurrences:
+        raise ValueError("matched more than once")
+    return compiled.sub(lambda m: re.sub(r"\$!(\d+)", lambda g: m.group(int(g.group(1))), repl), content)
+
+
+@pytest.fixture
+def fake_serena(monkeypatch):
+    async def run_steps(self, project_root, steps, writes):
+        applied = 0
+        for rel, text, n in writes:
+            (P.Path(project_root) / rel).write_text(text)
+            applied += n
+        for st in steps:
+            f = P.Path(project_root) / st["path"]
+            try:
+                f.write_text(_serena_replace_regex(f.read_text(), st["pattern"], st["replacement"]))
+            except ValueError:
+                continue
+            applied += 1
+        return applied
+
+    monkeypatch.setattr(P.SecureFixProcessor, "_run_serena_steps", run_steps)
+    monkeypatch.setattr(serena_runner, "run", lambda coro, timeout=None: asyncio.run(coro))
+    monkeypatch.setattr(serena_runner, "invalidate", lambda: None)
+
+
+def _instructions(root, steps):
+    body = P.orjson.dumps({"project_root": str(root), "steps": steps}).decode()
+    return f"{P.MARKER_START}\n{body}\n{P.MARKER_END}"
+
+
+CODE = "import os\n\ndef f(x):\n    return eval(x)\n\ndef g(y):\n    return y\n"
+CASES = [
+    # 1 match, backreference kiểu Serena
+    [{"pattern": r"return eval\((\w+)\)", "replacement": "return ast.literal_eval($!1)"}],
+    # \1 là chữ thường với Serena, không phải backreference
+    [{"pattern": r"eval\((\w+)\)", "replacement": r"safe(\1)"}],
+    # DOTALL mặc định: .* vượt dòng
+    [{"pattern": r"def f.*?eval", "replacement": "def f(x):\n    return safe"}],
+    # match nhiều lần → Serena từ chối, file giữ nguyên
+    [{"pattern": r"return", "replacement": "yield"}],
+    # MULTILINE mặc định: ^ khớp đầu dòng
+    [{"pattern": r"^import os$", "replacement": "import ast"}],
+]
+
+
+@pytest.mark.parametrize("steps", CASES)
+def test_local_regex_matches_serena(tmp_path, fake_serena, monkeypatch, steps):
+    steps = [{"op": "regex_replace", "path": "mod.py", **st} for st in steps]
+    local_root, serena_root = tmp_path / "local", tmp_path / "serena"
+    for root in (local_root, serena_root):
+        root.mkdir()
+        (root / "mod.py").write_text(CODE)
+
+    proc = P.SecureFixProcessor(str(local_root))
+    proc._apply_serena_fixes(CODE, _instructions(local_root, steps), str(local_root / "mod.py"))
+
+    monkeypatch.setattr(P.SecureFixProcessor, "_regex_only_steps", lambda *a: None)
+    proc = P.SecureFixProcessor(str(serena_root))
+    proc._apply_serena_fixes(CODE, _instructions(serena_root, steps), str(serena_root / "mod.py"))
+
+    assert (local_root / "mod.py").read_text() == (serena_root / "mod.py").read_text()
+
+
+def test_ambiguous_regex_goes_through_serena(tmp_path, fake_serena, monkeypatch):
+    (tmp_path / "mod.py").write_text(CODE)
+    sent = []
+    real = P.SecureFixProcessor._run_serena_steps
+
+    async def spy(self, project_root, steps, writes):
+        sent.append((list(steps), list(writes)))
+        return await real(self, project_root, steps, writes)
+
+    monkeypatch.setattr(P.SecureFixProcessor, "_run_serena_steps", spy)
+    steps = [{"op": "regex_replace", "path": "mod.py", "pattern": "return", "replacement": "yield"}]
+    proc = P.SecureFixProcessor(str(tmp_path))
+    applied, code = proc._apply_serena_fixes(CODE, _instructions(tmp_path, steps), str(tmp_path / "mod.py"))
+
+    assert (applied, code) == (False, None)
+    assert len(sent) == 1 and sent[0][0][0]["pattern"] == "return" and sent[0][1] == []
+    assert (tmp_path / "mod.py").read_text() == CODE
+
+
+def test_unique_regex_written_in_process(tmp_path, fake_serena, monkeypatch):
+    (tmp_path / "mod.py").write_text(CODE)
+    monkeypatch.setattr(P.SecureFixProcessor, "_run_serena_steps", None)  # không được gọi Serena
+    steps = [{"op": "regex_replace", "path": "mod.py", "pattern": r"eval\((\w+)\)", "replacement": "safe($!1)"}]
+    proc = P.SecureFixProcessor(str(tmp_path))
+    applied, code = proc._apply_serena_fixes(CODE, _instructions(tmp_path, steps), str(tmp_path / "mod.py"))
+
+    assert applied and code == CODE.replace("eval(x)", "safe(x)")
+    assert (tmp_path / "mod.py").read_text() == code
@@ -0,0 +1,35 @@
+from types import SimpleNamespace
+
+import pytest
+from google.genai import errors as genai_errors
+
+from src.app.api.routers import scanner_rag_router as R
+
+
+def _fake_embed(monkeypatch, batch):
+    calls = []
+
+    def embed_content(model, contents):
+        calls.append(contents)
+        if isinstance(contents, list):
+            return batch(contents)
+        return SimpleNamespace(embeddings=[SimpleNamespace(values=[float(len(contents))])])
+
+    monkeypatch.setattr(R.client.models, "embed_content", embed_content)
+    return calls
+
+
+def test_rate_limit_is_raised_without_per_text_retry(monkeypatch):
+    def batch(texts):
+        raise genai_errors.ClientError(429, {"error": {"message": "quota", "status": "RESOURCE_EXHAUSTED"}})
+
+    calls = _fake_embed(monkeypatch, batch)
+    with pytest.raises(genai_errors.ClientError):
+        R._embed_chunk(["a", "bb"])
+    assert len(calls) == 1
+
+
+def test_count_mismatch_falls_back_per_text(monkeypatch):
+    calls = _fake_embed(monkeypatch, lambda texts: SimpleNamespace(embeddings=[]))
+    assert R._embed_chunk(["a", "bb"]) == [[1.0], [2.0]]
+    assert calls == [["a", "bb"], "a", "bb"]